@@ -1,72 +1,151 @@
 import os
-from sqlite3 import IntegrityError
-import pdb
-
-from flask import Flask, render_template, request, flash, redirect, session, g, abort, jsonify
-from secret import user_key
-from flask_debugtoolbar import DebugToolbarExtension
-# from sqlalchemy.exc import IntegrityError
-import requests
-
+import base64
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import time
+
+import click
+from flask import (Flask, Blueprint, Response, make_response, render_template, request, flash, redirect, session, g, abort, jsonify,
+                   current_app, stream_with_context)
+from flask.cli import with_appcontext
+from sqlalchemy.exc import IntegrityError
+
+import config
 from forms import NewRecipeForm, UserAddForm, LoginForm, NewBoardForm
-from models import db, connect_db, User, UserRecipe, Board, Recipe
+from models import db, connect_db, User, UserRecipe, Board, Recipe, RecipeIngredient
+from recipe_cache import RecipeDetailCache
+from recipe_pool import RandomRecipePool
+from autocomplete import TitleIndex
+from recipe_summaries import SummaryRefresher, summarize
+from thumbnails import Thumbnails
+from page_cache import PageCache
+from spoonacular import SpoonacularClient, SpoonacularError
+from quota import priority, SEARCH
+from prefetch import Prefetcher
+from similar import SimilarRecipes
+from compression import Compressor
+import projections
+import metrics
+from passwords import hasher, PasswordHasherBusy
+import backup
 
 CURR_USER_KEY = "curr_user"
+# display fields of the logged in user, kept in the session so most requests don't need the users table
+CURR_USER_INFO_KEY = "curr_user_info"
+
+# every route is on this blueprint, which create_app registers on the app it makes
+main = Blueprint('main', __name__)
+# for the helpers below, which also run on threads that have no app context
+logger = logging.getLogger(__name__)
+
+spoonacular = SpoonacularClient()
+thumbnails = Thumbnails()
+page_cache = PageCache()
+compressor = Compressor()
+similar_recipes = SimilarRecipes()
+request_metrics = metrics.Metrics()
+spoonacular.add_hook(request_metrics.record_api_call)
+
+# ids at or above this number belong to recipes created by users (see UserRecipe)
+USER_RECIPE_START_ID = 10000000
+# how many recipe ids are sent in one bulk call, and how many bulk calls run at once
+BULK_CHUNK_SIZE = 25
+BULK_MAX_WORKERS = 4
+# how many results one page of search shows, and how many of those can be user recipes
+SEARCH_PAGE_SIZE = 12
+SEARCH_LOCAL_PER_PAGE = 4
+# how many recipes the homepage shows
+HOMEPAGE_RECIPE_COUNT = 100
+# how many saved recipes the JSON API reads from the database at a time while streaming a board
+API_STREAM_BATCH = 1000
 
-app = Flask(__name__)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///capstone_one'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = False
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
-app.config['SECRET_KEY'] = 'brockisgood'
-toolbar = DebugToolbarExtension(app)
+# Example:
+# data = spoonacular.search('chick', number=5)
 
-connect_db(app)
-# db.drop_all()
-db.create_all()
 
-# for the basic search
-baseURL = f'https://api.spoonacular.com/recipes/complexSearch?apiKey={user_key}'
-# url for a single recipe
-infoURL = f'https://api.spoonacular.com/recipes/118854/information?apiKey={user_key}'
-# url to get random recipes
-randomURL = f'https://api.spoonacular.com/recipes/random?apiKey={user_key}'
+@main.route('/')
+def homepage():
 
+    results = recipe_pool.sample(HOMEPAGE_RECIPE_COUNT)
+    
+    response = make_response(render_template('home.html', results=results))
+    return prefetcher.after_response(response, api_recipe_ids(results))
 
-# Example:
-# res = requests.get(baseURL, params={'query': 'chick', 'number': 5})
 
-# data = res.json()
+class SessionUser:
+    '''The logged in user, as stored in the signed session. The id and display fields
+    are read from the session; anything else loads the full User row the first time it is used.'''
 
+    def __init__(self, user_id, info, user=None):
+        self.id = user_id
+        self.username = info.get('username')
+        self.first_name = info.get('first_name')
+        self.last_name = info.get('last_name')
+        self._user = user
 
-@app.route('/')
-def homepage():
+    def load(self):
+        '''The full User row for this user. If the account has been deleted since they
+        logged in, they are logged out and sent to the login page.'''
 
-    res = requests.get(randomURL, params={'number': 100})
-    data = res.json()
-    results = data['recipes']
-    
-    return render_template('home.html', results=results)
+        if self._user is None:
+            self._user = User.query.get(self.id)
+            if self._user is None:
+                forget_user()
+                flash("Unauthorized access", 'danger')
+                abort(redirect('/login'))
+        return self._user
 
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
 
-@app.before_request
+
+def user_info(user):
+    '''The display fields of a user that are kept in the session'''
+
+    return {'username': user.username, 'first_name': user.first_name, 'last_name': user.last_name}
+
+
+@main.before_app_request
 def add_user_to_g():
-    '''If the user is logged in, add them to Flask global'''
+    '''If the user is logged in, add them to Flask global. Sessions from before the display
+    fields were kept in the session get them added here, once.
 
-    if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
-    else:
+    Pages are shown from the session alone, but requests that change something check
+    that the user still exists, so a user deleted from another browser is logged out
+    instead of writing rows that point at nobody.'''
+
+    if CURR_USER_KEY not in session:
         g.user = None
+        return
+
+    user = None
+    if CURR_USER_INFO_KEY not in session or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        user = User.query.get(session[CURR_USER_KEY])
+        if user is None:
+            forget_user()
+            return
+        session.setdefault(CURR_USER_INFO_KEY, user_info(user))
+    g.user = SessionUser(session[CURR_USER_KEY], session[CURR_USER_INFO_KEY], user)
 
 def do_login(user):
-    '''Log in user'''
+    '''Log in user. Call this again after changing a user's name so the session stays up to date.'''
 
     session[CURR_USER_KEY] = user.id
+    session[CURR_USER_INFO_KEY] = user_info(user)
+
+def forget_user():
+    '''Log out a user whose account no longer exists'''
+
+    session.pop(CURR_USER_KEY, None)
+    session.pop(CURR_USER_INFO_KEY, None)
+    g.user = None
 
 def do_logout():
     '''Logout user'''
 
+    session.pop(CURR_USER_INFO_KEY, None)
     if CURR_USER_KEY in session:
         del session[CURR_USER_KEY]
         flash("Successfully Logged Out", 'success')
@@ -76,7 +155,7 @@ def do_logout():
 # routes for user info ####################################################################
 
 
-@app.route('/signup', methods=["GET", "POST"])
+@main.route('/signup', methods=["GET", "POST"])
 def register():
     '''register a user'''
 
@@ -94,8 +173,13 @@ def register():
             db.session.commit()
 
         except IntegrityError:
+            db.session.rollback()
             flash("Username already taken", 'danger')
             return render_template('users/register.html', form=form)
+
+        except PasswordHasherBusy:
+            flash("Too many people are signing up right now, please try again in a moment", 'danger')
+            return render_template('users/register.html', form=form), 503
         
         do_login(user)
 
@@ -106,7 +190,7 @@ def register():
         return render_template('users/register.html', form=form)
 
 
-@app.route('/login', methods=["GET", "POST"])
+@main.route('/login', methods=["GET", "POST"])
 def login():
     '''Login user'''
 
@@ -117,9 +201,15 @@ def login():
     form = LoginForm()
 
     if form.validate_on_submit():
-        user = User.authenticate(form.username.data, form.password.data)
+        try:
+            user = User.authenticate(form.username.data, form.password.data)
+        except PasswordHasherBusy:
+            flash("Too many people are logging in right now, please try again in a moment", 'danger')
+            return render_template('users/login.html', form=form), 503
 
         if user:
+            # saves the password if authenticate hashed it again
+            db.session.commit()
             do_login(user)
             flash("You are successfully logged in!", 'success')
             return redirect(f"/users/{user.id}")
@@ -129,14 +219,14 @@ def login():
     return render_template('users/login.html', form=form)
 
 
-@app.route("/logout")
+@main.route("/logout")
 def logout():
     '''Handle logout for user.'''
 
     return do_logout()
 
 
-@app.route('/users/<int:user_id>')
+@main.route('/users/<int:user_id>')
 def show_user_profile(user_id):
     '''Show all information on the user, including name, profile name, and boards'''
 
@@ -146,12 +236,13 @@ def show_user_profile(user_id):
 
     user = User.query.get_or_404(user_id)
 
-    boards = (Board.query.filter(Board.user_id == user_id).all())
+    boards = Board.with_recipe_counts(user_id)
+    created_count = UserRecipe.query.filter(UserRecipe.user_id == user_id).count()
 
-    return render_template("users/show.html", user=user, boards=boards)
+    return render_template("users/show.html", user=user, boards=boards, created_count=created_count)
 
 
-@app.route("/users/delete", methods=["POST"])
+@main.route("/users/delete", methods=["POST"])
 def delete_user():
     '''Delete user'''
 
@@ -161,16 +252,49 @@ def delete_user():
 
     do_logout()
 
-    db.session.delete(g.user)
+    db.session.delete(g.user.load())
     db.session.commit()
 
     return redirect('/signup')
 
 
+@main.route("/users/export", methods=["GET"])
+def export_user():
+    '''Download the logged in user's boards and recipes as JSON Lines, streamed as they are read'''
+
+    if not g.user:
+        flash("Unauthorized access", 'danger')
+        return redirect('/login')
+
+    user = g.user.load()
+    response = Response(stream_with_context(backup.export_user(user)), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename="{user.username}-export.jsonl"'
+    return response
+
+
+@main.route("/users/import", methods=["POST"])
+def import_user():
+    '''Add the boards and recipes in a JSON Lines export, sent as the request body, to the logged in user.
+    The body is read a line at a time.'''
+
+    if not g.user:
+        return jsonify(error="Login required"), 401
+    # forms can't send this content type from other sites, so it also guards against CSRF
+    if request.mimetype != 'application/x-ndjson':
+        return jsonify(error="Send the export as application/x-ndjson"), 415
+
+    try:
+        counts = backup.import_user(g.user.load(), request.stream, on_recipe=title_index.add)
+    except backup.BackupError as e:
+        return jsonify(error=str(e)), 400
+
+    return jsonify(counts)
+
+
 # route for handling search inquiries ###########################################################
 
 
-@app.route('/results', methods=["GET"])
+@main.route('/results', methods=["GET"])
 def results():
 
     if not g.user:
@@ -178,19 +302,45 @@ def results():
         return redirect("/login")
 
     search = request.args.get('query')
-    user_recipes = UserRecipe.query.all()
-    recipes = [user_recipe for user_recipe in user_recipes if search.lower() in user_recipe.title.lower()]
-    results = requests.get(baseURL, params={'query': search, 'number': 100})
-    data = results.json()
-    info=data['results']
-    recipes_results = info + recipes
-    return render_template('index.html', results=recipes_results, search=search)
+    exclude = request.args.get('exclude', '')
+    recipes_results, next_cursor, partial = search_page(search, exclude=split_ingredients(exclude))
+
+    response = make_response(render_template('index.html', results=recipes_results, search=search, exclude=exclude,
+                                             partial=partial, next_cursor=next_cursor))
+    return prefetcher.after_response(response, api_recipe_ids(recipes_results))
+
+
+@main.route('/api/v1/search', methods=["GET"])
+@main.route('/api/search', methods=["GET"])
+def api_search():
+    '''One page of search results as recipe cards, used to load more results as the user scrolls'''
+
+    if not g.user:
+        return jsonify(error="Please login or signup before searching"), 401
+
+    search = request.args.get('query', '')
+    exclude = split_ingredients(request.args.get('exclude', ''))
+    try:
+        results, next_cursor, partial = search_page(search, request.args.get('cursor'), exclude)
+    except ValueError:
+        return jsonify(error="Invalid cursor"), 400
+
+    results = [projections.card(result, thumbnails.url) for result in results]
+
+    return jsonify(results=results, next_cursor=next_cursor, partial=partial)
+
+
+@main.route('/api/autocomplete', methods=["GET"])
+def api_autocomplete():
+    '''Recipe titles matching what has been typed into the search box so far'''
+
+    return jsonify(results=title_index.lookup(request.args.get('q', '')))
 
 
 # routes for handling user boards ################################################################
 
 
-@app.route('/users/boards/new', methods=["GET", "POST"])
+@main.route('/users/boards/new', methods=["GET", "POST"])
 def create_board():
     '''Create new board form'''
 
@@ -210,7 +360,7 @@ def create_board():
     return render_template("boards/create.html", form=form)
 
 
-@app.route("/recipe/<int:recipe_id>/add_to_board", methods=["GET"])
+@main.route("/recipe/<int:recipe_id>/add_to_board", methods=["GET"])
 def add_recipe_to_board_index(recipe_id):
     '''Open index of boards to add given recipe to'''
 
@@ -218,18 +368,17 @@ def add_recipe_to_board_index(recipe_id):
         flash("Unauthorized access", 'danger')
         return redirect('/login')
 
-    boards = (Board.query.filter(Board.user_id == g.user.id).all())
+    boards = Board.with_recipe_counts(g.user.id)
 
     if recipe_id > 9999999:
         recipe = UserRecipe.query.get_or_404(recipe_id)  
     else:
-        res = requests.get(f'https://api.spoonacular.com/recipes/{recipe_id}/information?apiKey={user_key}')
-        recipe = res.json() 
+        recipe = recipe_cache.get(recipe_id) or abort(404)
 
     return render_template("boards/add.html", boards=boards, recipe=recipe)
 
 
-@app.route("/boards/<int:board_id>/add/<int:recipe_id>", methods=["GET", "POST"])
+@main.route("/boards/<int:board_id>/add/<int:recipe_id>", methods=["GET", "POST"])
 def add_recipe_to_board(board_id, recipe_id):
     '''Add recipe to board'''
 
@@ -238,20 +387,20 @@ def add_recipe_to_board(board_id, recipe_id):
         return redirect('/login')
     
     board = Board.query.get_or_404(board_id)
-    
-    for recipe in board.recipe_ids:
-        if recipe_id == recipe.id:
-            flash("Recipe already in this board", 'danger')
-            return redirect(f"/users/{g.user.id}")
+    recipe = load_recipes([recipe_id]).get(recipe_id)
 
-    new_recipe = Recipe(board_id=board.id, id=recipe_id)
-    db.session.add(new_recipe)
+    added = Recipe.add_to_board(board.id, recipe_id, summarize(recipe) if recipe else None)
     db.session.commit()
 
+    if not added:
+        flash("Recipe already in this board", 'danger')
+    elif recipe:
+        similar_recipes.add(recipe)
+
     return redirect(f"/users/{g.user.id}")
 
 
-@app.route("/boards/<int:board_id>", methods=["GET"])
+@main.route("/boards/<int:board_id>", methods=["GET"])
 def show_board_recipes(board_id):
     '''show all recipes in created board'''
 
@@ -260,22 +409,13 @@ def show_board_recipes(board_id):
         return redirect('/login')
     
     board = Board.query.get_or_404(board_id)
-    recipes = []
-    board_recipes = (Recipe.query.filter(Recipe.board_id == board.id).all())
-
-    for recipe_query in board_recipes:
-        if recipe_query.id > 9999999:
-            recipe = UserRecipe.query.get_or_404(recipe_query.id)  
-        else:
-            res = requests.get(f'https://api.spoonacular.com/recipes/{recipe_query.id}/information?apiKey={user_key}')
-            recipe = res.json()
+    recipes = (Recipe.query.filter(Recipe.board_id == board.id).order_by(Recipe.unique_id).all())
+    recipe_summaries.fill_missing(recipes)
 
-        recipes.append(recipe)
-    
     return render_template("boards/index.html", recipes=recipes, board=board)
 
 
-@app.route("/users/created-recipes", methods=["GET"])
+@main.route("/users/created-recipes", methods=["GET"])
 def get_your_recipes():
     '''Index of users created recipes'''
 
@@ -284,26 +424,234 @@ def get_your_recipes():
     return render_template("boards/index.html", recipes=recipes)
 
 
+# helpers for loading many recipes at once #######################################################
+
+
+def fetch_recipe(recipe_id):
+    '''Get the information on a single Spoonacular recipe, or None if it can't be found'''
+
+    try:
+        return spoonacular.information(recipe_id)
+    except SpoonacularError:
+        logger.warning("Recipe fetch failed for id %s", recipe_id)
+        return None
+
+
+def fetch_recipe_chunk(recipe_ids):
+    '''Get the information on a chunk of Spoonacular recipes with one bulk call.
+    A failed call returns an empty list so the rest of the board still loads.'''
+
+    try:
+        return spoonacular.information_bulk(recipe_ids)
+    except SpoonacularError:
+        logger.warning("Bulk recipe fetch failed for ids %s", recipe_ids)
+        return []
+
+
+def fetch_api_recipes(recipe_ids):
+    '''Get the information on many Spoonacular recipes, splitting the ids into
+    chunks that are fetched in parallel. Returns a dict of recipe id -> recipe.'''
+
+    chunks = [recipe_ids[i:i + BULK_CHUNK_SIZE] for i in range(0, len(recipe_ids), BULK_CHUNK_SIZE)]
+    if not chunks:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(BULK_MAX_WORKERS, len(chunks))) as executor:
+        chunk_results = [future.result() for future in
+                         [metrics.submit(executor, fetch_recipe_chunk, chunk) for chunk in chunks]]
+
+    return {recipe['id']: recipe for chunk in chunk_results for recipe in chunk}
+
+
+def search_api_recipes(search, number, offset=0, exclude=()):
+    '''Search Spoonacular recipes. Returns the response data (with results and totalResults),
+    or None if the call fails.'''
+
+    try:
+        with priority(SEARCH):
+            return spoonacular.search(search, number, offset, exclude)
+    except SpoonacularError:
+        logger.warning("Recipe search failed for %r", search)
+        return None
+
+
+# runs the Spoonacular half of each search so it overlaps with the database half
+search_executor = ThreadPoolExecutor(max_workers=8)
+
+
+def split_ingredients(text):
+    '''Ingredient names from a comma separated list, e.g. "peanuts, shellfish"'''
+
+    return [name.strip() for name in text.split(',') if name.strip()]
+
+
+def encode_cursor(local_offset, remote_offset):
+    '''Cursor pointing at the next page, as an opaque url safe string'''
+
+    raw = json.dumps({'l': local_offset, 'r': remote_offset}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    '''Read the local and remote offsets from a cursor. Raises ValueError if it isn't valid.'''
+
+    if not cursor:
+        return 0, 0
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        local_offset, remote_offset = int(data['l']), int(data['r'])
+    except (TypeError, KeyError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+    if local_offset < -1 or remote_offset < -1:
+        raise ValueError("Invalid cursor")
+    return local_offset, remote_offset
+
+
+def search_page(search, cursor=None, exclude=()):
+    '''Get one page of search results, mixing user recipes into the Spoonacular results.
+    Recipes with any of the ingredients in exclude are left out of both.
+
+    The cursor keeps separate offsets into both sources, so pages never repeat or skip a
+    result. An offset of -1 means that source has nothing left. Spoonacular is searched in
+    the background and only waited on until SEARCH_TIME_BUDGET runs out; if it is late the
+    page is marked partial and the next cursor asks it for the same results again.
+
+    Returns (results, next_cursor, partial), where next_cursor is None on the last page.'''
+
+    local_offset, remote_offset = decode_cursor(cursor)
+    deadline = time.monotonic() + current_app.config['SEARCH_TIME_BUDGET']
+
+    remote = None
+    if remote_offset >= 0:
+        remote = metrics.submit(search_executor, search_api_recipes, search, SEARCH_PAGE_SIZE, remote_offset, exclude)
+
+    recipes = []
+    if local_offset >= 0:
+        local_limit = SEARCH_LOCAL_PER_PAGE if remote else SEARCH_PAGE_SIZE
+        recipes = [{'id': recipe.id, 'title': recipe.title, 'image': recipe.image}
+                   for recipe in UserRecipe.search(search, offset=local_offset, limit=local_limit,
+                                                     exclude_ingredients=exclude)]
+        local_offset = local_offset + len(recipes) if len(recipes) == local_limit else -1
+
+    info = []
+    partial = False
+    if remote:
+        try:
+            data = remote.result(timeout=max(deadline - time.monotonic(), 0))
+        except TimeoutError:
+            data = None
+        if data is None:
+            partial = True
+        else:
+            info = [{'id': recipe['id'], 'title': recipe['title'], 'image': recipe.get('image')}
+                    for recipe in data.get('results', [])[:SEARCH_PAGE_SIZE - len(recipes)]]
+            remote_offset += len(info)
+            if not info or remote_offset >= data.get('totalResults', 0):
+                remote_offset = -1
+
+    next_cursor = None
+    if local_offset >= 0 or remote_offset >= 0:
+        next_cursor = encode_cursor(local_offset, remote_offset)
+
+    return info + recipes, next_cursor, partial
+
+
+def fetch_autocomplete(prefix):
+    '''Get Spoonacular's title suggestions for a prefix, or an empty list if the call fails'''
+
+    try:
+        return spoonacular.autocomplete(prefix)
+    except SpoonacularError:
+        logger.warning("Autocomplete fetch failed for %r", prefix)
+        return []
+
+
+def fetch_random_recipes(number):
+    '''Get a list of random Spoonacular recipes, or an empty list if the call fails'''
+
+    try:
+        return spoonacular.random(number)
+    except (SpoonacularError, KeyError):
+        logger.warning("Random recipe fetch failed")
+        return []
+
+
+recipe_cache = RecipeDetailCache(fetch_one=fetch_recipe, fetch_many=fetch_api_recipes)
+recipe_pool = RandomRecipePool(
+    fetch_random=fetch_random_recipes,
+    on_fetched=lambda recipes: recipe_cache.store({recipe['id']: recipe for recipe in recipes})
+)
+title_index = TitleIndex(fetch_remote=fetch_autocomplete)
+prefetcher = Prefetcher(recipe_cache, fetch_many=fetch_api_recipes)
+
+
+def api_recipe_ids(results):
+    '''Ids of the Spoonacular recipes in a list of results, in order'''
+
+    return [result['id'] for result in results if result['id'] < USER_RECIPE_START_ID]
+
+
+def load_recipes(recipe_ids):
+    '''Load recipes from both the database and Spoonacular, as a dict of recipe id -> recipe.
+    User recipes are loaded with a single query, and recipes that fail to load are left out.'''
+
+    user_ids = [recipe_id for recipe_id in recipe_ids if recipe_id >= USER_RECIPE_START_ID]
+    api_ids = list(dict.fromkeys(recipe_id for recipe_id in recipe_ids if recipe_id < USER_RECIPE_START_ID))
+
+    found = {}
+    if user_ids:
+        found.update({recipe.id: recipe for recipe in UserRecipe.query.filter(UserRecipe.id.in_(user_ids)).all()})
+    found.update(recipe_cache.get_many(api_ids))
+
+    return found
+
+
+recipe_summaries = SummaryRefresher(load_recipes=load_recipes)
+
+
 # routes for handling recipe information #########################################################
 
 
-@app.route('/recipe/<int:recipe_id>', methods=["GET"])
+@main.route('/recipe/<int:recipe_id>', methods=["GET"])
 def show_recipe(recipe_id):
 
     if recipe_id > 9999999:
-        recipe = UserRecipe.query.get(recipe_id)
-        ingredients = [recipe.ingredient_1, recipe.ingredient_2, recipe.ingredient_3, recipe.ingredient_4, recipe.ingredient_5, recipe.ingredient_6, recipe.ingredient_7, recipe.ingredient_8, recipe.ingredient_9, recipe.ingredient_10, recipe.ingredient_11, recipe.ingredient_12, recipe.ingredient_13, recipe.ingredient_14, recipe.ingredient_15, recipe.ingredient_16, recipe.ingredient_17, recipe.ingredient_18, recipe.ingredient_19, recipe.ingredient_20]
-        return render_template('recipes/user_recipe.html', recipe=recipe, ingredients=ingredients)
-    res = requests.get(f'https://api.spoonacular.com/recipes/{recipe_id}/information?apiKey={user_key}')
-    if res:
-        data = res.json()
+        return show_created_recipe(recipe_id)
+    prefetcher.record_view(recipe_id)
+    data = recipe_cache.get(recipe_id)
+    if data:
         instructions = data['instructions']
-        return render_template('recipes/recipe.html', recipe=data, instructions=instructions)
+        similar = similar_recipes.similar(data)
+        return page_cache.render([data, similar], 'recipes/recipe.html', recipe=data, instructions=instructions,
+                                 similar=similar)
     else:
         return abort(404)
+
+
+@main.route('/cache/stats', methods=["GET"])
+def show_cache_stats():
+    '''Hit and miss counters for the recipe information cache'''
+
+    return jsonify(recipe_cache.get_stats())
+
+
+request_metrics.add_collector(lambda: metrics.gauges(
+    'recipe_cache', 'Recipe information cache counters', recipe_cache.get_stats(), 'stat'))
+request_metrics.add_collector(lambda: metrics.gauges(
+    'spoonacular_flights', 'Spoonacular calls sent, and calls that shared one already in flight',
+    spoonacular.flights.stats, 'kind'))
+request_metrics.add_collector(lambda: metrics.gauges(
+    'spoonacular_quota', 'Spoonacular quota points left, and calls sent or turned away by priority',
+    spoonacular.scheduler.get_stats(), 'stat'))
+request_metrics.add_collector(lambda: metrics.gauges(
+    'recipe_prefetch', 'Recipes prefetched after search and homepage responses, and how many were viewed',
+    prefetcher.get_stats(), 'stat'))
+request_metrics.add_collector(lambda: metrics.gauges(
+    'similar_recipes', 'Recipes and ingredients in the similar recipes index, and its last build time',
+    similar_recipes.get_stats(), 'stat'))
     
     
-@app.route('/recipe/new', methods=["GET", "POST"])
+@main.route('/recipe/new', methods=["GET", "POST"])
 def create_recipe():
     '''Page with form for creating new recipes'''
 
@@ -320,60 +668,131 @@ def create_recipe():
             title=form.title.data,
             image=form.image.data or "https://spoonacular.com/recipeImages/621204-556x370.jpg",
             user_id=user_id,
-            ingredient_1=form.ingredient_1.data,
-            ingredient_2=form.ingredient_2.data,
-            ingredient_3=form.ingredient_3.data,
-            ingredient_4=form.ingredient_4.data,
-            ingredient_5=form.ingredient_5.data,
-            ingredient_6=form.ingredient_6.data,
-            ingredient_7=form.ingredient_7.data,
-            ingredient_8=form.ingredient_8.data,
-            ingredient_9=form.ingredient_9.data,
-            ingredient_10=form.ingredient_10.data,
-            ingredient_11=form.ingredient_11.data,
-            ingredient_12=form.ingredient_12.data,
-            ingredient_13=form.ingredient_13.data,
-            ingredient_14=form.ingredient_14.data,
-            ingredient_15=form.ingredient_15.data,
-            ingredient_16=form.ingredient_16.data,
-            ingredient_17=form.ingredient_17.data,
-            ingredient_18=form.ingredient_18.data,
-            ingredient_19=form.ingredient_19.data,
-            ingredient_20=form.ingredient_20.data,
+            ingredients=RecipeIngredient.from_list(form.ingredient_list()),
             instructions=form.instructions.data
             )
         db.session.add(recipe)
         db.session.commit()
+        title_index.add(recipe.id, recipe.title)
+        similar_recipes.add(recipe)
         
         return redirect(f'/recipe/created/{recipe.id}')
 
     return render_template('recipes/new.html', form=form)
 
 
-@app.route('/recipe/created/<int:recipe_id>', methods=["GET"])
+@main.route('/recipe/created/<int:recipe_id>', methods=["GET"])
 def show_created_recipe(recipe_id):
     '''Shows information on recipe that was just created by a user. This will allow the user_recipes to reload with the new recipe.'''
 
     recipe = UserRecipe.query.get_or_404(recipe_id)
-    ingredients = [recipe.ingredient_1, recipe.ingredient_2, recipe.ingredient_3, recipe.ingredient_4, recipe.ingredient_5, recipe.ingredient_6, recipe.ingredient_7, recipe.ingredient_8, recipe.ingredient_9, recipe.ingredient_10, recipe.ingredient_11, recipe.ingredient_12, recipe.ingredient_13, recipe.ingredient_14, recipe.ingredient_15, recipe.ingredient_16, recipe.ingredient_17, recipe.ingredient_18, recipe.ingredient_19, recipe.ingredient_20]
-
-    return render_template("recipes/user_recipe.html", recipe=recipe, ingredients=ingredients)
-
+    ingredients = recipe.ingredient_list()
+    similar = similar_recipes.similar(recipe)
+    content = [recipe.id, recipe.title, recipe.image, recipe.instructions, ingredients, similar]
 
+    return page_cache.render(content, "recipes/user_recipe.html", recipe=recipe, ingredients=ingredients,
+                             similar=similar)
 
 
+# versioned JSON API #############################################################################
+# Trimmed versions of the pages above for scripts and mobile clients (see projections.py).
+# Search is /api/v1/search, above.
 
 
+@main.route('/api/v1/recipes/<int:recipe_id>', methods=["GET"])
+def api_recipe(recipe_id):
+    '''The fields of a recipe that its page shows'''
 
+    if recipe_id >= USER_RECIPE_START_ID:
+        recipe = UserRecipe.query.get(recipe_id)
+    else:
+        prefetcher.record_view(recipe_id)
+        recipe = recipe_cache.get(recipe_id)
+    if not recipe:
+        return jsonify(error="Recipe not found"), 404
 
-
-    
-
+    return jsonify(projections.detail(recipe))
 
 
+@main.route('/api/v1/users/<int:user_id>/boards', methods=["GET"])
+def api_user_boards(user_id):
+    '''A user's boards and how many recipes each has'''
 
+    if not g.user:
+        return jsonify(error="Login required"), 401
+    if User.query.get(user_id) is None:
+        return jsonify(error="User not found"), 404
 
+    boards = Board.with_recipe_counts(user_id)
+    return jsonify(boards=[projections.board(board, count) for board, count in boards])
 
 
+@main.route('/api/v1/boards/<int:board_id>/recipes', methods=["GET"])
+def api_board_recipes(board_id):
+    '''The recipes on a board as cards. Boards can hold thousands of recipes, so the
+    list is streamed from a server side cursor as it is encoded.'''
 
-    
\ No newline at end of file
+    if not g.user:
+        return jsonify(error="Login required"), 401
+    board = Board.query.get(board_id)
+    if board is None:
+        return jsonify(error="Board not found"), 404
+
+    recipe_summaries.fill_missing(
+        Recipe.query.filter(Recipe.board_id == board.id, Recipe.refreshed_at.is_(None)).all())
+    rows = (db.session.query(Recipe.id, Recipe.title, Recipe.image)
+            .filter(Recipe.board_id == board.id)
+            .order_by(Recipe.unique_id)
+            .yield_per(API_STREAM_BATCH))
+    body = projections.stream_json({'board': projections.board(board)}, 'recipes',
+                                   (projections.card(row, thumbnails.url) for row in rows))
+
+    return Response(stream_with_context(body), mimetype='application/json')
+
+
+# app factory ####################################################################################
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    '''Create any database tables that don't exist yet'''
+
+    db.create_all()
+    click.echo('Created the database tables.')
+
+
+def create_app(settings=None):
+    '''Make the app, configured from the environment (see config.py) and then settings.
+    Nothing touches the database or Spoonacular until the first request.
+
+    Run it with FLASK_APP=app flask run, or gunicorn "app:create_app()".'''
+
+    app = Flask(__name__)
+    app.config.update(config.from_env())
+    app.config.update(settings or {})
+
+    # first, so it compresses what every other after_request hook has left
+    compressor.init_app(app)
+    connect_db(app)
+    hasher.init_app(app)
+    spoonacular.init_app(app)
+    recipe_cache.init_app(app)
+    recipe_pool.init_app(app)
+    title_index.init_app(app)
+    prefetcher.init_app(app)
+    similar_recipes.init_app(app)
+    recipe_summaries.init_app(app)
+    thumbnails.init_app(app)
+    page_cache.init_app(app)
+    request_metrics.init_app(app)
+
+    if app.config['DEBUG_TB_ENABLED']:
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+
+    app.register_blueprint(main)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(backup.export_command)
+    app.cli.add_command(backup.import_command)
+    return app
@@ -0,0 +1,151 @@
+'''In-memory prefix index of recipe titles for the search box autocomplete.
+
+Every word of every title is kept in a sorted list, so all titles with a word
+starting with what the user typed sit next to each other and can be found with
+two binary searches. A query of several words only walks the smallest of their
+ranges, at most LOOKUP_SCAN entries of it, and checks the other words against
+the words of each title found. Nothing touches the database or the API while
+answering.
+
+The index is filled with UserRecipe titles when the app starts, grows as users
+create recipes, and learns Spoonacular titles in the background: when a prefix
+has few matches, Spoonacular's autocomplete is asked once for it and the
+answers are added for the next keystroke. Only the AUTOCOMPLETE_MAX_LEARNED
+most recently learned Spoonacular titles are kept.
+'''
+
+import bisect
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from models import UserRecipe
+from recipe_cache import LRUCache
+
+# most entries one lookup looks at, so a query of only common words stays fast
+LOOKUP_SCAN = 2000
+
+
+def title_words(title):
+    '''The distinct words of a title, lower cased'''
+
+    return tuple(set(re.findall(r'\w+', title.lower())))
+
+
+class TitleIndex:
+    '''Sorted (word, title, id) entries, one for each word of each title'''
+
+    def __init__(self, fetch_remote=None, app=None):
+        self.fetch_remote = fetch_remote
+        self.entries = []
+        # words of each title by recipe id, each after a space, e.g. ' butter chicken'
+        self.words = {}
+        # ids of titles learned from Spoonacular, oldest first
+        self.learned = OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.asked = LRUCache(10000)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Read autocomplete settings from the app config and load titles before the first request'''
+
+        self.app = app
+        self.min_remote_results = app.config.setdefault('AUTOCOMPLETE_MIN_RESULTS', 5)
+        self.max_learned = app.config.setdefault('AUTOCOMPLETE_MAX_LEARNED', 5000)
+        app.before_first_request(self.load)
+
+    def load(self):
+        '''Fill the index with the titles of every user recipe, sorting the entries once at the end'''
+
+        titles = UserRecipe.query.with_entities(UserRecipe.id, UserRecipe.title).yield_per(1000)
+        loaded = {recipe_id: (title, title_words(title)) for recipe_id, title in titles}
+
+        with self.lock:
+            entries = [(word, title, recipe_id) for recipe_id, (title, words) in loaded.items()
+                       if recipe_id not in self.words for word in words]
+            for recipe_id, (title, words) in loaded.items():
+                self.words.setdefault(recipe_id, ' ' + ' '.join(words))
+            entries.extend(self.entries)
+            entries.sort()
+            self.entries = entries
+
+    def add(self, recipe_id, title):
+        '''Add one title to the index'''
+
+        with self.lock:
+            if recipe_id in self.words:
+                return
+            words = title_words(title)
+            self.words[recipe_id] = ' ' + ' '.join(words)
+            for word in words:
+                bisect.insort(self.entries, (word, title, recipe_id))
+
+    def forget_learned(self):
+        '''Drop the oldest tenth of the learned titles once there are more than max_learned'''
+
+        with self.lock:
+            if len(self.learned) <= self.max_learned:
+                return
+            forgotten = set()
+            for _ in range(max(len(self.learned) - self.max_learned, self.max_learned // 10)):
+                forgotten.add(self.learned.popitem(last=False)[0])
+            self.entries = [entry for entry in self.entries if entry[2] not in forgotten]
+            for recipe_id in forgotten:
+                self.words.pop(recipe_id, None)
+
+    def lookup(self, query, limit=10):
+        '''Titles with a word starting with each word of query, as a list of {id, title}'''
+
+        words = re.findall(r'\w+', query.lower())
+        if not words:
+            return []
+
+        # walk the entries of the word with the fewest, and check the others against each title's words
+        entries = self.entries
+        ranges = []
+        for word in set(words):
+            start = bisect.bisect_left(entries, (word,))
+            end = bisect.bisect_left(entries, (word + '\uffff',))
+            ranges.append((end - start, start, word))
+        size, start, first = min(ranges)
+        # a title has a word starting with other if ' other' is in its words
+        others = [' ' + word for count, index, word in ranges if word != first]
+
+        results = []
+        seen = set()
+        for index in range(start, start + min(size, LOOKUP_SCAN)):
+            word, title, recipe_id = entries[index]
+            if recipe_id in seen:
+                continue
+            seen.add(recipe_id)
+            words_of_title = self.words.get(recipe_id, '')
+            if all(other in words_of_title for other in others):
+                results.append({'id': recipe_id, 'title': title})
+                if len(results) >= limit:
+                    break
+
+        if len(results) < self.min_remote_results:
+            self.learn_later(' '.join(words))
+
+        return results
+
+    def learn_later(self, prefix):
+        '''Ask Spoonacular about a prefix in the background, once per prefix'''
+
+        if self.fetch_remote is None or len(prefix) < 2 or self.asked.get(prefix):
+            return
+        self.asked.set(prefix, True)
+        self.executor.submit(self.learn, prefix)
+
+    def learn(self, prefix):
+        try:
+            for recipe in self.fetch_remote(prefix):
+                if recipe['id'] not in self.words:
+                    self.add(recipe['id'], recipe['title'])
+                    self.learned[recipe['id']] = True
+            self.forget_learned()
+        except Exception:
+            self.app.logger.exception("Learning autocomplete titles for %r failed", prefix)
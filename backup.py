@@ -0,0 +1,209 @@
+'''Export and import of a user's boards and recipes as JSON Lines.
+
+An export is one JSON object per line: a header, then every recipe the user
+created, then their boards, then every recipe saved to those boards:
+
+    {"type": "export", "version": 1, "username": "brock"}
+    {"type": "recipe", "id": 10000003, "title": "...", "image": "...", "instructions": "...", "ingredients": ["..."]}
+    {"type": "board", "id": 7, "name": "Dinners"}
+    {"type": "saved", "board": 7, "id": 716429, "title": "...", "image": "...", "source": "spoonacular"}
+
+Rows are read through server side cursors and written out as they arrive, and
+imports are inserted in batches, so memory use stays the same however many
+recipes a user has saved. Importing gives boards and created recipes new ids,
+and saved recipes that point at an imported recipe are pointed at its new id.
+'''
+
+import json
+from itertools import groupby
+
+import click
+from flask.cli import with_appcontext
+
+from models import db, User, UserRecipe, Board, Recipe, RecipeIngredient
+
+VERSION = 1
+# rows fetched from a server side cursor at a time, and rows inserted per statement
+BATCH_SIZE = 1000
+
+
+class BackupError(ValueError):
+    '''An import contains a line that can't be read'''
+
+
+def line(data):
+    return json.dumps(data, separators=(',', ':')) + '\n'
+
+
+def export_user(user):
+    '''Yield the lines of an export of user's recipes and boards'''
+
+    yield line({'type': 'export', 'version': VERSION, 'username': user.username})
+
+    recipes = (db.session.query(UserRecipe.id, UserRecipe.title, UserRecipe.image, UserRecipe.instructions,
+                                RecipeIngredient.original)
+               .outerjoin(RecipeIngredient, RecipeIngredient.recipe_id == UserRecipe.id)
+               .filter(UserRecipe.user_id == user.id)
+               .order_by(UserRecipe.id, RecipeIngredient.position)
+               .yield_per(BATCH_SIZE))
+    # one row per ingredient, so the rows of a recipe are grouped back together
+    for (recipe_id, title, image, instructions), rows in groupby(recipes, key=lambda row: row[:4]):
+        yield line({'type': 'recipe', 'id': recipe_id, 'title': title, 'image': image,
+                    'instructions': instructions, 'ingredients': [row.original for row in rows if row.original]})
+
+    boards = (db.session.query(Board.id, Board.name)
+              .filter(Board.user_id == user.id)
+              .order_by(Board.id)
+              .yield_per(BATCH_SIZE))
+    for board_id, name in boards:
+        yield line({'type': 'board', 'id': board_id, 'name': name})
+
+    saved = (db.session.query(Recipe.board_id, Recipe.id, Recipe.title, Recipe.image, Recipe.source)
+             .join(Board, Board.id == Recipe.board_id)
+             .filter(Board.user_id == user.id)
+             .order_by(Recipe.board_id, Recipe.unique_id)
+             .yield_per(BATCH_SIZE))
+    for board_id, recipe_id, title, image, source in saved:
+        yield line({'type': 'saved', 'board': board_id, 'id': recipe_id, 'title': title, 'image': image,
+                    'source': source})
+
+
+class UserImport:
+    '''Adds the lines of an export to a user, a batch at a time'''
+
+    def __init__(self, user):
+        self.user = user
+        # (new id, title) of every recipe created
+        self.created = []
+        self.board_ids = {}
+        self.recipe_ids = {}
+        self.recipes = []
+        self.saved = []
+        self.counts = {'recipes': 0, 'boards': 0, 'saved': 0}
+
+    def add(self, data):
+        kind = data.get('type')
+        if kind == 'export':
+            if data.get('version') != VERSION:
+                raise BackupError(f"Unsupported export version {data.get('version')}")
+        elif kind == 'recipe':
+            self.recipes.append((data['id'], UserRecipe(
+                title=data['title'],
+                image=data.get('image'),
+                instructions=data.get('instructions'),
+                user_id=self.user.id,
+                ingredients=RecipeIngredient.from_list(data.get('ingredients', []))
+            )))
+            if len(self.recipes) >= BATCH_SIZE:
+                self.flush_recipes()
+        elif kind == 'board':
+            self.add_board(data['id'], data['name'])
+        elif kind == 'saved':
+            self.saved.append((data['board'], data['id'], data))
+            if len(self.saved) >= BATCH_SIZE:
+                self.flush_saved()
+        else:
+            raise BackupError(f"Unknown line type {kind!r}")
+
+    def add_board(self, old_id, name):
+        board = Board(name=name, user_id=self.user.id)
+        db.session.add(board)
+        db.session.flush()
+        self.board_ids[old_id] = board.id
+        self.counts['boards'] += 1
+        db.session.expunge(board)
+
+    def flush_recipes(self):
+        '''Insert the waiting recipes, then let go of them'''
+
+        if not self.recipes:
+            return
+        db.session.add_all(recipe for _, recipe in self.recipes)
+        db.session.flush()
+        for old_id, recipe in self.recipes:
+            self.recipe_ids[old_id] = recipe.id
+            self.created.append((recipe.id, recipe.title))
+            db.session.expunge(recipe)
+        self.counts['recipes'] += len(self.recipes)
+        self.recipes = []
+
+    def flush_saved(self):
+        '''Insert the waiting saved recipes with one statement per board'''
+
+        # saved recipes can point at recipes still waiting to get their new ids
+        self.flush_recipes()
+        rows = sorted(self.saved, key=lambda row: row[0])
+        self.saved = []
+        for old_board_id, board_rows in groupby(rows, key=lambda row: row[0]):
+            if old_board_id not in self.board_ids:
+                raise BackupError(f"Recipe saved to board {old_board_id}, which isn't in the export")
+            recipe_ids = []
+            summaries = {}
+            for _, old_id, data in board_rows:
+                recipe_id = self.recipe_ids.get(old_id, old_id)
+                recipe_ids.append(recipe_id)
+                if data.get('title'):
+                    summaries[recipe_id] = {key: data.get(key) for key in ('title', 'image', 'source')}
+            self.counts['saved'] += Recipe.add_many_to_board(self.board_ids[old_board_id], recipe_ids, summaries)
+
+    def finish(self):
+        self.flush_saved()
+        return self.counts
+
+
+def import_user(user, lines, on_recipe=None):
+    '''Add the boards and recipes in the lines of an export to user and commit them, then call
+    on_recipe(id, title) for every recipe created. Returns how many recipes, boards and saved
+    recipes were added. If a line can't be read nothing is added, and BackupError is raised.'''
+
+    importer = UserImport(user)
+    try:
+        for number, text in enumerate(lines, 1):
+            if not text.strip():
+                continue
+            try:
+                importer.add(json.loads(text))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                raise BackupError(f"Line {number}: {e}") from e
+        counts = importer.finish()
+    except Exception:
+        db.session.rollback()
+        raise
+    db.session.commit()
+
+    # only now, so nothing hears about recipes that were rolled back
+    if on_recipe:
+        for recipe_id, title in importer.created:
+            on_recipe(recipe_id, title)
+    return counts
+
+
+@click.command('export-user')
+@click.argument('username')
+@click.argument('output', type=click.File('w'), default='-')
+@with_appcontext
+def export_command(username, output):
+    '''Write a user's boards and recipes to OUTPUT as JSON Lines'''
+
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user named {username}")
+    output.writelines(export_user(user))
+
+
+@click.command('import-user')
+@click.argument('username')
+@click.argument('source', type=click.File('r'), default='-')
+@with_appcontext
+def import_command(username, source):
+    '''Add the boards and recipes in a JSON Lines export to a user'''
+
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user named {username}")
+    try:
+        counts = import_user(user, source)
+    except BackupError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Imported {counts['recipes']} recipes, {counts['boards']} boards "
+               f"and {counts['saved']} saved recipes")
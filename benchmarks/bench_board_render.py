@@ -0,0 +1,107 @@
+'''Benchmark: how long /boards/<id> takes to render as the board grows.
+
+Spoonacular is replaced with a fake that sleeps for a fixed latency per call,
+so the numbers show how the number of round trips grows with board size.
+The cold column starts with an empty recipe cache, the warm column does not.
+
+Run from the project root with:
+
+    createdb capstone_one-test
+    python -m benchmarks.bench_board_render
+'''
+
+import os
+import time
+from unittest import mock
+
+os.environ['DATABASE_URL'] = 'postgresql:///capstone_one-test'
+
+from app import create_app, CURR_USER_KEY, recipe_cache, spoonacular
+from models import db, User, Board, Recipe, UserRecipe, RecipeIngredient
+
+# no quota, so the numbers only show round trips
+app = create_app({'SPOONACULAR_DAILY_POINTS': 10 ** 9})
+
+BOARD_SIZES = [1, 10, 30, 60, 120]
+API_LATENCY = 0.15
+RUNS = 3
+
+
+class FakeResponse:
+    '''Stand-in for a requests.Response holding a bulk information payload'''
+
+    status_code = 200
+    headers = {}
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+def fake_get(url, params=None, **kwargs):
+    '''Sleep like a real API call, then answer with one recipe per requested id'''
+
+    time.sleep(API_LATENCY)
+    ids = [int(recipe_id) for recipe_id in (params or {}).get('ids', '').split(',') if recipe_id]
+    return FakeResponse([{'id': recipe_id, 'title': f'Recipe {recipe_id}', 'image': 'x.jpg'} for recipe_id in ids])
+
+
+def setup_board(size):
+    '''Create a user and a board with size recipes, a quarter of them user recipes'''
+
+    db.drop_all()
+    db.create_all()
+
+    user = User.register('bench', 'password', 'bench@bench.com', 'Bench', 'Mark')
+    db.session.commit()
+    board = Board(name='bench', user_id=user.id)
+    db.session.add(board)
+    db.session.commit()
+
+    for i in range(size):
+        if i % 4 == 0:
+            user_recipe = UserRecipe(title=f'Mine {i}', user_id=user.id, instructions='c',
+                                     ingredients=RecipeIngredient.from_list(['1 cup a', '2 tbsp b']))
+            db.session.add(user_recipe)
+            db.session.flush()
+            recipe_id = user_recipe.id
+        else:
+            recipe_id = 1000 + i
+        db.session.add(Recipe(board_id=board.id, id=recipe_id))
+    db.session.commit()
+
+    return user.id, board.id
+
+
+def main():
+    client = app.test_client()
+    print(f"{'recipes':>8} {'cold ms':>10} {'warm ms':>10}")
+
+    for size in BOARD_SIZES:
+        user_id, board_id = setup_board(size)
+        recipe_cache.memory.clear()
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+        with mock.patch.object(spoonacular.session, 'get', side_effect=fake_get):
+            start = time.perf_counter()
+            res = client.get(f'/boards/{board_id}')
+            assert res.status_code == 200
+            cold = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(RUNS):
+                res = client.get(f'/boards/{board_id}')
+                assert res.status_code == 200
+            warm = (time.perf_counter() - start) / RUNS
+
+        print(f"{size:>8} {cold * 1000:>10.1f} {warm * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+'''Benchmark: what a login storm does to logins and to the rest of the site.
+
+Serves the app like benchmarks.load_test, then has --logins workers log in over
+and over while --browsers workers load a board page. Prints login throughput,
+how many logins were turned away with a 503, and the board page's latency
+during the storm next to its latency with no logins going on.
+
+Compare hashing in the request threads with hashing on the process pool:
+
+    createdb capstone_one-test
+    python -m benchmarks.bench_login_storm --workers 0
+    python -m benchmarks.bench_login_storm --workers 2
+'''
+
+import argparse
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+from benchmarks import fake_spoonacular
+from benchmarks.load_test import QuietRequestHandler, logged_in_session, percentile, setup
+
+os.environ['DATABASE_URL'] = 'postgresql:///capstone_one-test'
+
+
+def browse(session, url, seconds):
+    '''Load url over and over for seconds. Returns the timings.'''
+
+    timings = []
+    stop = time.perf_counter() + seconds
+    while time.perf_counter() < stop:
+        start = time.perf_counter()
+        session.get(url)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def log_in(base_url, seconds):
+    '''Log in over and over for seconds. Returns the timings of successful logins and the number turned away.'''
+
+    timings = []
+    busy = 0
+    stop = time.perf_counter() + seconds
+    while time.perf_counter() < stop:
+        start = time.perf_counter()
+        res = requests.post(f'{base_url}/login', data={'username': 'loadtest', 'password': 'password'},
+                            allow_redirects=False)
+        if res.status_code == 503:
+            busy += 1
+        else:
+            timings.append(time.perf_counter() - start)
+    return timings, busy
+
+
+def summary(timings):
+    timings = sorted(timings)
+    return (f'p50 {statistics.median(timings) * 1000:7.1f}ms  p95 {percentile(timings, 95) * 1000:7.1f}ms  '
+            f'p99 {percentile(timings, 99) * 1000:7.1f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure logins and page latency during a login storm')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='password hashing processes, 0 for none')
+    parser.add_argument('--rounds', type=int, default=12, help='bcrypt work factor')
+    parser.add_argument('--logins', type=int, default=16, help='workers logging in at once')
+    parser.add_argument('--browsers', type=int, default=4, help='workers loading the board page at once')
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    fake = fake_spoonacular.start(latency=0.01)
+    os.environ['SPOONACULAR_BASE_URL'] = fake.url
+
+    from app import create_app
+    app = create_app({'WTF_CSRF_ENABLED': False, 'PASSWORD_WORKERS': args.workers, 'BCRYPT_LOG_ROUNDS': args.rounds,
+                      'SPOONACULAR_DAILY_POINTS': 10 ** 9})
+    board_id = setup(app)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    url = f'{base_url}/boards/{board_id}'
+
+    # logging in also starts the hashing processes before anything is measured
+    sessions = [logged_in_session(base_url) for _ in range(args.browsers)]
+
+    with ThreadPoolExecutor(max_workers=args.browsers) as executor:
+        quiet = [t for timings in executor.map(lambda session: browse(session, url, args.seconds / 2), sessions)
+                 for t in timings]
+
+    with ThreadPoolExecutor(max_workers=args.logins + args.browsers) as executor:
+        logins = [executor.submit(log_in, base_url, args.seconds) for _ in range(args.logins)]
+        pages = [executor.submit(browse, session, url, args.seconds) for session in sessions]
+        login_timings = [t for future in logins for t in future.result()[0]]
+        busy = sum(future.result()[1] for future in logins)
+        storm = [t for future in pages for t in future.result()]
+
+    server.shutdown()
+
+    print(f'hashing workers: {args.workers or "none, in request threads"}, rounds: {args.rounds}')
+    print(f'logins:           {len(login_timings) / args.seconds:6.1f}/s, {busy} turned away')
+    print(f'login latency:    {summary(login_timings)}')
+    print(f'board, no storm:  {summary(quiet)}')
+    print(f'board, storm:     {summary(storm)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+'''Benchmark: building the similar recipes index, and looking recipes up in it.
+
+Recipes are generated in memory with 6 to 16 ingredients each, drawn from a
+vocabulary where a few ingredients are in most recipes and most are rare, which
+is what real recipes look like. No database is needed.
+
+For each size it prints the build time, the latency of a lookup of an indexed
+recipe, of a query for a recipe that isn't indexed, and of adding a recipe.
+
+Run from the project root with:
+
+    python -m benchmarks.bench_similar
+'''
+
+import random
+import statistics
+import time
+
+from similar import SimilarityIndex
+
+SIZES = [1000, 10000, 100000]
+VOCABULARY = [f'ingredient {n}' for n in range(3000)]
+# Zipf-like popularity, so "ingredient 0" is in about half of the recipes
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+TOP_K = 8
+RUNS = 200
+
+
+def recipes(count, start=0):
+    rng = random.Random(start)
+    for recipe_id in range(start, start + count):
+        names = rng.choices(VOCABULARY, WEIGHTS, k=rng.randint(6, 16))
+        yield recipe_id, names, {'id': recipe_id, 'title': f'Recipe {recipe_id}', 'image': None}
+
+
+def timed(fn, args):
+    timings = []
+    for arg in args:
+        start = time.perf_counter()
+        fn(*arg)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return statistics.median(timings) * 1000, timings[int(len(timings) * 0.95)] * 1000
+
+
+def main():
+    print(f"{'recipes':>8} {'build s':>8} {'lookup p50/p95 ms':>18} {'query p50/p95 ms':>17} {'add p50/p95 ms':>15}")
+    for size in SIZES:
+        generated = list(recipes(size))
+        start = time.perf_counter()
+        index = SimilarityIndex(generated, top_k=TOP_K)
+        build = time.perf_counter() - start
+
+        rng = random.Random(size)
+        lookup = timed(index.similar, [(rng.randrange(size),) for _ in range(RUNS)])
+        extra = list(recipes(RUNS, start=size))
+        query = timed(index.query, [(recipe_id, names) for recipe_id, names, card in extra])
+        add = timed(index.add, extra[:RUNS // 4])
+
+        print(f"{size:>8} {build:>8.2f} {lookup[0]:>8.3f} / {lookup[1]:<7.3f} {query[0]:>7.2f} / {query[1]:<7.2f} "
+              f"{add[0]:>6.2f} / {add[1]:<6.2f}")
+
+
+if __name__ == '__main__':
+    main()
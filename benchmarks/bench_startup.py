@@ -0,0 +1,55 @@
+'''Benchmark: how long a fresh worker takes from import to its first response.
+
+Each run starts a new Python process, which imports app, calls create_app and
+serves one request through the test client, timing each step. That is what a
+new gunicorn worker goes through before it can take traffic.
+
+Run from the project root with:
+
+    createdb capstone_one-test
+    FLASK_APP=app DATABASE_URL=postgresql:///capstone_one-test flask init-db
+    python -m benchmarks.bench_startup
+'''
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks import fake_spoonacular
+
+RUNS = 10
+PATHS = ['/login', '/']
+
+WORKER = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app({'RANDOM_POOL_BACKGROUND': False, 'RECIPE_SUMMARY_BACKGROUND': False})
+created = time.perf_counter()
+res = flask_app.test_client().get(sys.argv[1])
+responded = time.perf_counter()
+assert res.status_code == 200, res.status_code
+print(json.dumps({'import': imported - start, 'create_app': created - imported,
+                  'first response': responded - created, 'total': responded - start}))
+'''
+
+
+def main():
+    fake = fake_spoonacular.start(latency=0.05)
+    env = dict(os.environ, DATABASE_URL='postgresql:///capstone_one-test', SPOONACULAR_BASE_URL=fake.url)
+
+    print(f"{'path':<8} {'import ms':>10} {'create_app ms':>14} {'first response ms':>18} {'total ms':>9}")
+    for path in PATHS:
+        runs = [json.loads(subprocess.run([sys.executable, '-c', WORKER, path], env=env, check=True,
+                                          stdout=subprocess.PIPE).stdout)
+                for _ in range(RUNS)]
+        medians = {step: statistics.median(run[step] for run in runs) * 1000 for step in runs[0]}
+        print(f"{path:<8} {medians['import']:>10.1f} {medians['create_app']:>14.1f} "
+              f"{medians['first response']:>18.1f} {medians['total']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
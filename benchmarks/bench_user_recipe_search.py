@@ -0,0 +1,83 @@
+'''Benchmark: search latency over user recipes as the table grows.
+
+Rows are generated in the database with generate_series so seeding a million
+recipes takes seconds, then UserRecipe.search is timed for a few queries.
+
+Run from the project root with:
+
+    createdb capstone_one-test
+    python -m benchmarks.bench_user_recipe_search
+'''
+
+import os
+import statistics
+import time
+
+os.environ['DATABASE_URL'] = 'postgresql:///capstone_one-test'
+
+from app import create_app
+from models import db, User, UserRecipe
+
+app = create_app()
+
+TABLE_SIZES = [1000, 10000, 100000, 1000000]
+QUERIES = ['chicken', 'chick', 'garlic butter', 'chocolate cake', 'zucchini']
+RUNS = 20
+
+WORDS = "(SELECT ARRAY['chicken', 'garlic', 'butter', 'pasta', 'chocolate', 'cake', 'rice'] AS words) AS w"
+
+SEED_SQL = f'''
+INSERT INTO user_recipes (id, title, user_id, instructions, search_vector)
+SELECT n, words[1 + n % 7] || ' ' || words[1 + (n / 7) % 7] || ' ' || n, :user_id, 'Mix everything and cook.', NULL
+FROM generate_series(:start, :stop - 1) AS n, {WORDS}
+'''
+
+INGREDIENT_SQL = f'''
+INSERT INTO user_recipe_ingredients (recipe_id, position, original, name)
+SELECT n, p, '1 cup ' || words[1 + (n / (3 + p * 8)) % 7], words[1 + (n / (3 + p * 8)) % 7]
+FROM generate_series(:start, :stop - 1) AS n, generate_series(0, 1) AS p, {WORDS}
+'''
+
+VECTOR_SQL = '''
+UPDATE user_recipes SET search_vector =
+    setweight(to_tsvector('english', title), 'A') ||
+    setweight(to_tsvector('english', (SELECT string_agg(original, ' ') FROM user_recipe_ingredients
+                                      WHERE recipe_id = user_recipes.id)), 'B') ||
+    setweight(to_tsvector('english', instructions), 'C')
+WHERE search_vector IS NULL
+'''
+
+
+def main():
+    db.drop_all()
+    db.create_all()
+    user = User.register('bench', 'password', 'bench@bench.com', 'Bench', 'Mark')
+    db.session.commit()
+
+    print(f"{'recipes':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    seeded = 0
+    for size in TABLE_SIZES:
+        params = {'user_id': user.id, 'start': 10000000 + seeded, 'stop': 10000000 + size}
+        db.session.execute(SEED_SQL, params)
+        db.session.execute(INGREDIENT_SQL, params)
+        db.session.execute(VECTOR_SQL)
+        db.session.commit()
+        db.session.execute('ANALYZE user_recipes')
+        db.session.execute('ANALYZE user_recipe_ingredients')
+        seeded = size
+
+        timings = []
+        for _ in range(RUNS):
+            for query in QUERIES:
+                start = time.perf_counter()
+                UserRecipe.search(query)
+                timings.append(time.perf_counter() - start)
+                db.session.expunge_all()
+
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95)]
+        print(f"{size:>9} {statistics.median(timings) * 1000:>8.2f} {p95 * 1000:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+'''A local stand-in for the Spoonacular endpoints the app uses.
+
+Every response waits latency seconds (plus up to jitter more), and error_rate
+of them fail with a 500 or a 429, so benchmarks can be run reproducibly and
+without spending API quota. Recipes are made up from their ids. Responses carry
+the same quota headers as the real API, counting down from quota points; once
+they run out every call gets a 402.
+
+Start it on its own with:
+
+    python -m benchmarks.fake_spoonacular --port 8088 --latency 0.2 --error-rate 0.05
+
+and point the app at it with SPOONACULAR_BASE_URL=http://127.0.0.1:8088.
+'''
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+WORDS = ['Chicken', 'Garlic', 'Butter', 'Pasta', 'Chocolate', 'Cake', 'Rice', 'Lemon', 'Beef', 'Salad']
+
+
+def fake_recipe(recipe_id):
+    '''A recipe with the fields the app reads, made up from its id'''
+
+    title = f'{WORDS[recipe_id % 10]} {WORDS[recipe_id // 10 % 10]} {recipe_id}'
+    return {
+        'id': recipe_id,
+        'title': title,
+        'image': f'https://spoonacular.com/recipeImages/{recipe_id}-556x370.jpg',
+        'instructions': 'Mix everything together and cook until done.',
+        'sourceUrl': f'https://example.com/recipes/{recipe_id}',
+        'extendedIngredients': [
+            {'original': f'1 cup {WORDS[(recipe_id + n) % 10].lower()}', 'name': WORDS[(recipe_id + n) % 10].lower()}
+            for n in range(8)
+        ],
+    }
+
+
+def points_charged(path, params):
+    '''Points the real API charges for a call'''
+
+    if path == '/recipes/autocomplete':
+        return 0.1
+    if path == '/recipes/informationBulk':
+        return 1 + 0.5 * (len(params.get('ids', '').split(',')) - 1)
+    if path in ('/recipes/random', '/recipes/complexSearch'):
+        return 1 + 0.01 * int(params.get('number', 10))
+    return 1
+
+
+class FakeSpoonacularHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        server = self.server
+
+        time.sleep(server.latency + random.random() * server.jitter)
+        with server.lock:
+            server.calls[url.path.split('/')[-1]] += 1
+
+        if random.random() < server.error_rate:
+            return self.reply(random.choice([500, 429]), {'message': 'injected error'})
+
+        number = int(params.get('number', 10))
+        points = points_charged(url.path, params)
+        with server.lock:
+            if server.points_used + points > server.quota:
+                return self.reply(402, {'message': 'daily points limit reached'})
+            server.points_used += points
+        self.quota_headers = {'X-API-Quota-Request': points, 'X-API-Quota-Used': server.points_used,
+                              'X-API-Quota-Left': server.quota - server.points_used}
+        offset = int(params.get('offset', 0))
+
+        if url.path == '/recipes/random':
+            body = {'recipes': [fake_recipe(random.randrange(1, 1000000)) for _ in range(number)]}
+        elif url.path == '/recipes/complexSearch':
+            body = {'results': [fake_recipe(offset + n + 1) for n in range(number)], 'totalResults': 900}
+        elif url.path == '/recipes/informationBulk':
+            body = [fake_recipe(int(recipe_id)) for recipe_id in params.get('ids', '').split(',') if recipe_id]
+        elif url.path == '/recipes/autocomplete':
+            body = [{'id': n + 1, 'title': f"{params.get('query', '')} {WORDS[n]}"} for n in range(number)]
+        elif url.path.endswith('/information'):
+            body = fake_recipe(int(url.path.split('/')[2]))
+        else:
+            return self.reply(404, {'message': 'not found'})
+
+        self.reply(200, body)
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in getattr(self, 'quota_headers', {}).items():
+            self.send_header(name, str(value))
+        self.quota_headers = {}
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start(port=0, latency=0.1, jitter=0.0, error_rate=0.0, quota=float('inf')):
+    '''Start the fake server in a background thread. Its address is server.url,
+    server.calls counts the calls made to each endpoint and server.points_used
+    the quota points they cost.'''
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeSpoonacularHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.jitter = jitter
+    server.error_rate = error_rate
+    server.lock = threading.Lock()
+    server.calls = Counter()
+    server.quota = quota
+    server.points_used = 0
+    server.url = f'http://127.0.0.1:{server.server_port}'
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8088)
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds every response waits')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many more seconds at random')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of responses that fail')
+    parser.add_argument('--quota', type=float, default=float('inf'), help='daily points before calls get a 402')
+    args = parser.parse_args()
+
+    server = start(args.port, args.latency, args.jitter, args.error_rate, args.quota)
+    print(f'Fake Spoonacular listening on {server.url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
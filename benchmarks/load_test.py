@@ -0,0 +1,179 @@
+'''Load test of the main routes against a fake Spoonacular.
+
+Starts benchmarks.fake_spoonacular, seeds the database with a user, a board and
+some user recipes, serves the app on a local port, then drives each scenario
+at every concurrency level and prints p50/p95/p99 latency and throughput.
+
+Run from the project root with:
+
+    createdb capstone_one-test
+    python -m benchmarks.load_test --save benchmarks/baseline.json
+    python -m benchmarks.load_test --compare benchmarks/baseline.json
+
+--compare exits with status 1 if any p95 got more than --tolerance percent slower.
+'''
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from benchmarks import fake_spoonacular
+
+os.environ['DATABASE_URL'] = 'postgresql:///capstone_one-test'
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    '''Don't log every request the load test makes'''
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def percentile(timings, pct):
+    '''The pct percentile of a sorted list of timings'''
+
+    return timings[min(len(timings) - 1, int(len(timings) * pct / 100))]
+
+
+def setup(app):
+    '''Create a user with a board of saved recipes and some user recipes. Returns the board id.'''
+
+    from models import db, User, Board, Recipe, UserRecipe, RecipeIngredient
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        user = User.register('loadtest', 'password', 'load@test.com', 'Load', 'Test')
+        db.session.commit()
+        board = Board(name='load', user_id=user.id)
+        db.session.add(board)
+        for n in range(20):
+            db.session.add(UserRecipe(title=f'Chicken Dish {n}', user_id=user.id, instructions='Cook it.',
+                                      ingredients=RecipeIngredient.from_list(['1 lb chicken', '1 cup rice'])))
+        db.session.commit()
+
+        Recipe.add_many_to_board(board.id, range(1, 41))
+        db.session.commit()
+        return board.id
+
+
+def logged_in_session(base_url):
+    session = requests.Session()
+    res = session.post(f'{base_url}/login', data={'username': 'loadtest', 'password': 'password'}, allow_redirects=False)
+    assert res.status_code == 302, f'login failed with {res.status_code}'
+    return session
+
+
+def run_scenario(base_url, name, path, concurrency, requests_per_worker):
+    '''Send requests to path from concurrency workers at once. Returns timings and errors.'''
+
+    def worker(_):
+        timings = []
+        errors = 0
+        session = None if name == 'login' else logged_in_session(base_url)
+        for _ in range(requests_per_worker):
+            start = time.perf_counter()
+            if name == 'login':
+                res = requests.post(f'{base_url}/login', data={'username': 'loadtest', 'password': 'password'},
+                                    allow_redirects=False)
+            else:
+                res = session.get(f'{base_url}{path}')
+            timings.append(time.perf_counter() - start)
+            errors += res.status_code >= 400
+        return timings, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    timings = sorted(timing for worker_timings, _ in results for timing in worker_timings)
+    return {
+        'requests': len(timings),
+        'errors': sum(errors for _, errors in results),
+        'p50': statistics.median(timings) * 1000,
+        'p95': percentile(timings, 95) * 1000,
+        'p99': percentile(timings, 99) * 1000,
+        'rps': len(timings) / elapsed,
+    }
+
+
+def compare(results, baseline, tolerance):
+    '''Print every scenario whose p95 got slower than the baseline by more than tolerance percent'''
+
+    regressions = 0
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        before = baseline[key]['p95']
+        change = (result['p95'] - before) / before * 100 if before else 0
+        if change > tolerance:
+            regressions += 1
+            print(f'REGRESSION {key}: p95 {before:.1f}ms -> {result["p95"]:.1f}ms ({change:+.0f}%)')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the app against a fake Spoonacular')
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds every fake API response waits')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of fake API responses that fail')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=20, help='requests sent by each worker')
+    parser.add_argument('--quota', type=float, default=10 ** 9, help='daily Spoonacular points the app may spend')
+    parser.add_argument('--save', help='write the results to this json file')
+    parser.add_argument('--compare', help='compare the results with this json file')
+    parser.add_argument('--tolerance', type=float, default=20, help='allowed p95 slowdown, in percent')
+    args = parser.parse_args()
+
+    fake = fake_spoonacular.start(latency=args.latency, error_rate=args.error_rate)
+    os.environ['SPOONACULAR_BASE_URL'] = fake.url
+
+    from app import create_app
+    app = create_app({'WTF_CSRF_ENABLED': False, 'SPOONACULAR_DAILY_POINTS': args.quota})
+    board_id = setup(app)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    scenarios = [
+        ('home', '/'),
+        ('search', '/results?query=chicken'),
+        ('board', f'/boards/{board_id}'),
+        ('recipe', '/recipe/716429'),
+        ('login', '/login'),
+    ]
+
+    results = {}
+    print(f"{'scenario':<10} {'workers':>7} {'requests':>8} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>7}")
+    for name, path in scenarios:
+        for concurrency in args.concurrency:
+            result = run_scenario(base_url, name, path, concurrency, args.requests)
+            results[f'{name}@{concurrency}'] = result
+            print(f"{name:<10} {concurrency:>7} {result['requests']:>8} {result['errors']:>6} {result['p50']:>8.1f} "
+                  f"{result['p95']:>8.1f} {result['p99']:>8.1f} {result['rps']:>7.1f}")
+
+    print(f"Fake Spoonacular calls: {dict(fake.calls)}")
+    server.shutdown()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+'''Compression of responses for clients that ask for it.
+
+JSON and stylesheets compress to a fraction of their size, which matters most
+to phones on slow connections. Compressor looks at each response's
+Accept-Encoding and, for text it knows compresses well, sends it brotli or gzip
+encoded, preferring brotli. Brotli needs the Brotli package; without it only
+gzip is offered.
+
+Only responses under COMPRESS_PATHS (the JSON API and static files) are
+compressed. HTML pages carry the CSRF token next to text reflected from the
+request, like the search query, and compressing them would let an attacker
+recover the token from the compressed sizes (BREACH).
+
+Responses smaller than COMPRESS_MIN_SIZE bytes are sent as they are. Streamed
+responses are compressed as they stream, without a Content-Length. Compressed
+responses have their ETag made weak, since the bytes differ from the identity
+encoding while the content is the same.
+'''
+
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from flask import request
+
+COMPRESS_MIMETYPES = {'text/css', 'text/plain', 'application/javascript',
+                      'application/json', 'application/x-ndjson'}
+
+
+class Compressor:
+    '''Negotiates and applies the Content-Encoding of responses'''
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Read compression settings from the app config and compress responses after every request.
+        Call this before anything else that changes responses after requests, so it runs last.'''
+
+        self.min_size = app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+        self.gzip_level = app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+        # brotli's default quality is meant for static files and is too slow for every response
+        self.brotli_quality = app.config.setdefault('COMPRESS_BROTLI_QUALITY', 4)
+        self.encodings = ['br', 'gzip'] if brotli else ['gzip']
+        self.paths = tuple(app.config.setdefault('COMPRESS_PATHS', ('/api/', f'{app.static_url_path}/')))
+        app.after_request(self.compress)
+
+    def compressor(self, encoding):
+        '''A new (compress(bytes), finish()) pair for encoding'''
+
+        if encoding == 'br':
+            stream = brotli.Compressor(quality=self.brotli_quality)
+            return stream.process, stream.finish
+        stream = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return stream.compress, stream.flush
+
+    def compress(self, response):
+        if response.mimetype not in COMPRESS_MIMETYPES or not request.path.startswith(self.paths):
+            return response
+        response.vary.add('Accept-Encoding')
+
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers
+                or (response.content_length is not None and response.content_length < self.min_size)):
+            return response
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+
+        # static files are passed through from send_file, and are read here to compress them instead
+        response.direct_passthrough = False
+
+        if response.is_streamed:
+            if hasattr(response.response, 'close'):
+                # still close the file or cursor behind the body once it is sent
+                response.call_on_close(response.response.close)
+            response.response = self.stream(response.iter_encoded(), encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            process, finish = self.compressor(encoding)
+            response.set_data(process(data) + finish())
+
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def stream(self, chunks, encoding):
+        '''Compress a streamed body as it is sent'''
+
+        process, finish = self.compressor(encoding)
+        for chunk in chunks:
+            data = process(chunk)
+            if data:
+                yield data
+        yield finish()
@@ -0,0 +1,51 @@
+'''App settings, read from the environment when an app is created.
+
+    DATABASE_URL              postgres database to use, defaults to postgresql:///capstone_one
+    SECRET_KEY                key used to sign sessions
+    SPOONACULAR_API_KEY       Spoonacular API key, falling back to user_key in secret.py
+    SPOONACULAR_BASE_URL      where to send Spoonacular calls, point it at a stub to test
+    SPOONACULAR_POOL_SIZE     connections kept open to Spoonacular per worker
+    SPOONACULAR_DAILY_POINTS  the Spoonacular plan's daily quota, in points
+    SEARCH_TIME_BUDGET        seconds a search waits for Spoonacular before showing what it has
+    BCRYPT_LOG_ROUNDS         bcrypt work factor for new passwords
+    PREFETCH_ENABLED          set to 1 to prefetch the top results of searches and the homepage
+    SLOW_REQUEST_THRESHOLD    requests slower than this many seconds are logged with their timing breakdown
+    DEBUG_TOOLBAR             set to 1 to install the debug toolbar
+'''
+
+import os
+
+
+def spoonacular_api_key():
+    '''The Spoonacular API key from the environment, or from secret.py when it isn't set there'''
+
+    key = os.environ.get('SPOONACULAR_API_KEY')
+    if key:
+        return key
+    try:
+        from secret import user_key
+    except ImportError:
+        return None
+    return user_key
+
+
+def from_env():
+    '''Settings for a new app, as a dict for app.config.update'''
+
+    return {
+        'SQLALCHEMY_DATABASE_URI': os.environ.get('DATABASE_URL', 'postgresql:///capstone_one'),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SQLALCHEMY_ECHO': False,
+        'SECRET_KEY': os.environ.get('SECRET_KEY', 'brockisgood'),
+        'SEARCH_TIME_BUDGET': float(os.environ.get('SEARCH_TIME_BUDGET', 2.0)),
+        'SPOONACULAR_API_KEY': spoonacular_api_key(),
+        'SPOONACULAR_BASE_URL': os.environ.get('SPOONACULAR_BASE_URL', 'https://api.spoonacular.com'),
+        'SPOONACULAR_POOL_SIZE': int(os.environ.get('SPOONACULAR_POOL_SIZE', 10)),
+        'SPOONACULAR_DAILY_POINTS': float(os.environ.get('SPOONACULAR_DAILY_POINTS', 150)),
+        'BCRYPT_LOG_ROUNDS': int(os.environ.get('BCRYPT_LOG_ROUNDS', 12)),
+        'PREFETCH_ENABLED': os.environ.get('PREFETCH_ENABLED') == '1',
+        'SLOW_REQUEST_THRESHOLD': float(os.environ.get('SLOW_REQUEST_THRESHOLD', 1.0)),
+        # the toolbar slows every page down, so it is only installed when asked for
+        'DEBUG_TB_ENABLED': os.environ.get('DEBUG_TOOLBAR') == '1',
+        'DEBUG_TB_INTERCEPT_REDIRECTS': False,
+    }
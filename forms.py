@@ -53,5 +53,10 @@ class NewRecipeForm(FlaskForm):
     ingredient_19 = StringField("Ingredient (Optional): ")
     ingredient_20 = StringField("Ingredient (Optional): ")
     instructions = TextAreaField("Instructions: ", validators=[InputRequired()])
+
+    def ingredient_list(self):
+        '''What was typed into each ingredient field, in order'''
+
+        return [getattr(self, f'ingredient_{num}').data for num in range(1, 21)]
     
     
\ No newline at end of file
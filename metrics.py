@@ -0,0 +1,196 @@
+'''Where request time goes, per route.
+
+For every request we record the total time, and how much of it was spent in
+SQL, in calls to Spoonacular and in rendering templates, plus how many queries
+and API calls were made. These go into histograms served in the Prometheus text
+format at /metrics, and requests slower than SLOW_REQUEST_THRESHOLD seconds are
+logged with their breakdown.
+
+Work done for a request on another thread (like the Spoonacular half of a
+search) is counted for that request when it is started with submit().
+'''
+
+import bisect
+import contextvars
+import threading
+import time
+from collections import defaultdict
+
+from flask import before_render_template, g, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# the RequestStats of the request being handled, also seen by threads started with submit()
+current_stats = contextvars.ContextVar('current_stats', default=None)
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+
+
+def submit(executor, fn, *args):
+    '''executor.submit(fn, *args), counting what fn does for the current request'''
+
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def gauges(name, help, values, label):
+    '''Metrics lines for a gauge with one series per key of values, named by label'''
+
+    lines = [f'# HELP {name} {help}', f'# TYPE {name} gauge']
+    lines.extend(f'{name}{{{label}="{key}"}} {value}' for key, value in sorted(values.items()))
+    return lines
+
+
+class RequestStats:
+    '''Time and calls of one request'''
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_seconds = 0.0
+        self.sql_queries = 0
+        self.api_seconds = 0.0
+        self.api_calls = 0
+        self.render_seconds = 0.0
+        self.render_depth = 0
+        self.render_start = 0.0
+        self.lock = threading.Lock()
+
+    def add_sql(self, seconds):
+        with self.lock:
+            self.sql_seconds += seconds
+            self.sql_queries += 1
+
+    def add_api(self, seconds):
+        with self.lock:
+            self.api_seconds += seconds
+            self.api_calls += 1
+
+
+class Histogram:
+    '''Prometheus histogram with one series per route'''
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = defaultdict(lambda: [[0] * (len(buckets) + 1), 0.0])
+        self.lock = threading.Lock()
+
+    def observe(self, route, value):
+        with self.lock:
+            series = self.series[route]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            for route, (counts, total) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_sum{{route="{route}"}} {total}')
+                lines.append(f'{self.name}_count{{route="{route}"}} {cumulative}')
+        return lines
+
+
+class Metrics:
+    '''Collects RequestStats for every request and serves them at /metrics'''
+
+    def __init__(self, app=None):
+        self.histograms = {
+            'total': Histogram('request_duration_seconds', 'Time to handle a request', TIME_BUCKETS),
+            'sql': Histogram('request_sql_seconds', 'Time a request spent in SQL', TIME_BUCKETS),
+            'sql_count': Histogram('request_sql_queries', 'SQL queries run by a request', COUNT_BUCKETS),
+            'api': Histogram('request_api_seconds', 'Time a request spent calling Spoonacular', TIME_BUCKETS),
+            'api_count': Histogram('request_api_calls', 'Spoonacular calls made by a request', COUNT_BUCKETS),
+            'render': Histogram('request_render_seconds', 'Time a request spent rendering templates', TIME_BUCKETS),
+        }
+        self.collectors = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Hook into the app's requests, SQL and templates, and add the /metrics route'''
+
+        self.app = app
+        self.slow_threshold = app.config.setdefault('SLOW_REQUEST_THRESHOLD', 1.0)
+
+        app.before_request(self.start_request)
+        app.teardown_request(self.finish_request)
+        before_render_template.connect(self.start_render, app)
+        template_rendered.connect(self.finish_render, app)
+        if not event.contains(Engine, 'before_cursor_execute', self.start_query):
+            event.listen(Engine, 'before_cursor_execute', self.start_query)
+            event.listen(Engine, 'after_cursor_execute', self.finish_query)
+        app.add_url_rule('/metrics', 'metrics', self.serve)
+
+    def add_collector(self, collect):
+        '''Also serve the metrics lines returned by collect() at /metrics'''
+
+        self.collectors.append(collect)
+
+    def record_api_call(self, seconds):
+        '''Count a Spoonacular call. Pass this to SpoonacularClient.add_hook.'''
+
+        stats = current_stats.get()
+        if stats is not None:
+            stats.add_api(seconds)
+
+    def start_request(self):
+        g.request_stats = RequestStats()
+        g.request_stats_token = current_stats.set(g.request_stats)
+
+    def finish_request(self, exc=None):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return
+        current_stats.reset(g.pop('request_stats_token'))
+
+        total = time.perf_counter() - stats.start
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        for key, value in (('total', total), ('sql', stats.sql_seconds), ('sql_count', stats.sql_queries),
+                           ('api', stats.api_seconds), ('api_count', stats.api_calls),
+                           ('render', stats.render_seconds)):
+            self.histograms[key].observe(route, value)
+
+        if total >= self.slow_threshold:
+            self.app.logger.warning(
+                "Slow request %s %s took %.3fs: sql %.3fs in %d queries, api %.3fs in %d calls, render %.3fs",
+                request.method, request.path, total, stats.sql_seconds, stats.sql_queries,
+                stats.api_seconds, stats.api_calls, stats.render_seconds)
+
+    def start_render(self, sender, **extra):
+        stats = current_stats.get()
+        if stats is not None:
+            # cards are rendered inside pages, so only time the outermost template
+            if stats.render_depth == 0:
+                stats.render_start = time.perf_counter()
+            stats.render_depth += 1
+
+    def finish_render(self, sender, **extra):
+        stats = current_stats.get()
+        if stats is not None and stats.render_depth:
+            stats.render_depth -= 1
+            if stats.render_depth == 0:
+                stats.render_seconds += time.perf_counter() - stats.render_start
+
+    def start_query(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def finish_query(self, conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info['query_start'].pop()
+        stats = current_stats.get()
+        if stats is not None:
+            stats.add_sql(seconds)
+
+    def serve(self):
+        '''All metrics in the Prometheus text format'''
+
+        lines = []
+        for histogram in self.histograms.values():
+            lines.extend(histogram.render())
+        for collect in self.collectors:
+            lines.extend(collect())
+        return '\n'.join(lines) + '\n', 200, {'Content-Type': 'text/plain; version=0.0.4'}
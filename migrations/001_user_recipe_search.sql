@@ -0,0 +1,17 @@
+-- Full text search over user recipes (used by UserRecipe.search).
+-- db.create_all() only creates missing tables, so run this once on an existing database:
+--
+--   psql capstone_one -f migrations/001_user_recipe_search.sql
+
+ALTER TABLE user_recipes ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+UPDATE user_recipes SET search_vector =
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', concat_ws(' ',
+        ingredient_1, ingredient_2, ingredient_3, ingredient_4, ingredient_5,
+        ingredient_6, ingredient_7, ingredient_8, ingredient_9, ingredient_10,
+        ingredient_11, ingredient_12, ingredient_13, ingredient_14, ingredient_15,
+        ingredient_16, ingredient_17, ingredient_18, ingredient_19, ingredient_20)), 'B') ||
+    setweight(to_tsvector('english', coalesce(instructions, '')), 'C');
+
+CREATE INDEX IF NOT EXISTS ix_user_recipes_search_vector ON user_recipes USING gin (search_vector);
@@ -0,0 +1,52 @@
+'''Move user recipe ingredients out of the ingredient_1 ... ingredient_20 columns
+and into the user_recipe_ingredients table, then drop the old columns.
+
+It is written in Python so ingredient names are normalized exactly the way new
+recipes are. Run it once, from the project root, after 001_user_recipe_search.sql:
+
+    python -m migrations.002_normalize_ingredients
+'''
+
+from app import create_app
+from models import db, UserRecipe, RecipeIngredient, search_vector_for
+
+BATCH_SIZE = 1000
+COLUMNS = [f'ingredient_{num}' for num in range(1, 21)]
+
+
+def main():
+    recipes = UserRecipe.__table__
+    RecipeIngredient.__table__.create(db.engine, checkfirst=True)
+
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            f"SELECT id, title, instructions, {', '.join(COLUMNS)} FROM user_recipes "
+            "WHERE id > :last_id ORDER BY id LIMIT :limit",
+            {'last_id': last_id, 'limit': BATCH_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+
+        for row in rows:
+            ingredients = RecipeIngredient.from_list([row[column] for column in COLUMNS])
+            for ingredient in ingredients:
+                ingredient.recipe_id = row.id
+            db.session.add_all(ingredients)
+            db.session.execute(
+                recipes.update()
+                .where(recipes.c.id == row.id)
+                .values(search_vector=search_vector_for(row.title, [i.original for i in ingredients], row.instructions))
+            )
+
+        db.session.commit()
+        last_id = rows[-1].id
+        print(f"Moved ingredients for recipes up to id {last_id}")
+
+    db.session.execute(f"ALTER TABLE user_recipes {', '.join(f'DROP COLUMN {column}' for column in COLUMNS)}")
+    db.session.commit()
+
+
+if __name__ == '__main__':
+    with create_app().app_context():
+        main()
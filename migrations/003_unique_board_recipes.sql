@@ -0,0 +1,10 @@
+-- One row per recipe per board (used by Recipe.add_to_board).
+-- Removes duplicates saved before the constraint existed, keeping the oldest row:
+--
+--   psql capstone_one -f migrations/003_unique_board_recipes.sql
+
+DELETE FROM recipe a
+USING recipe b
+WHERE a.board_id = b.board_id AND a.id = b.id AND a.unique_id > b.unique_id;
+
+ALTER TABLE recipe ADD CONSTRAINT uq_recipe_board_id_id UNIQUE (board_id, id);
@@ -0,0 +1,12 @@
+-- Card summaries on saved recipes (see recipe_summaries.py). Existing rows are
+-- filled in when their board is next viewed, or by the background refresh:
+--
+--   psql capstone_one -f migrations/004_recipe_summaries.sql
+
+ALTER TABLE recipe
+    ADD COLUMN IF NOT EXISTS title text,
+    ADD COLUMN IF NOT EXISTS image text,
+    ADD COLUMN IF NOT EXISTS source varchar(20),
+    ADD COLUMN IF NOT EXISTS refreshed_at timestamp;
+
+CREATE INDEX IF NOT EXISTS ix_recipe_refreshed_at ON recipe (refreshed_at);
@@ -0,0 +1,8 @@
+-- When loading a saved recipe for its card summary last failed (see recipe_summaries.py):
+--
+--   psql capstone_one -f migrations/005_summary_failures.sql
+
+ALTER TABLE recipe ADD COLUMN IF NOT EXISTS refresh_failed_at timestamp;
+
+-- rows that failed before this column existed were marked as refreshed without a summary
+UPDATE recipe SET refreshed_at = NULL WHERE title IS NULL;
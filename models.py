@@ -1,15 +1,17 @@
 from datetime import datetime
+from itertools import chain
 from array import array
 import email
-from sqlalchemy import String, Text, Sequence
-from sqlalchemy.dialects.postgresql import ARRAY
+import re
+from sqlalchemy import String, Text, Sequence, event
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR, insert
 
-from flask_bcrypt import Bcrypt
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import backref
 from sqlalchemy.sql.schema import ForeignKey
 
-bcrypt = Bcrypt()
+from passwords import hasher
+
 db = SQLAlchemy()
 
 
@@ -32,11 +34,9 @@ class User(db.Model):
     def register(cls, username, password, email, first_name, last_name):
         '''Register user and hash password'''
 
-        hashed = bcrypt.generate_password_hash(password)
-        hashed_utf8 = hashed.decode("UTF-8")
         user = cls(
             username=username,
-            password=hashed_utf8,
+            password=hasher.hash(password),
             email=email,
             first_name=first_name,
             last_name=last_name
@@ -48,11 +48,14 @@ class User(db.Model):
 
     @classmethod
     def authenticate(cls, username, password):
-        '''Authenticate a user to see if they used the correct username and password'''
+        '''Authenticate a user to see if they used the correct username and password.
+        A password hashed with an old work factor is hashed again, to be saved with the next commit.'''
 
         user = User.query.filter_by(username=username).first()
 
-        if user and bcrypt.check_password_hash(user.password, password):
+        if user and hasher.check(user.password, password):
+            if hasher.needs_rehash(user.password):
+                user.password = hasher.hash(password)
             return user
         else:
             return False
@@ -69,6 +72,17 @@ class Board(db.Model):
 
     recipe_ids = db.relationship("Recipe", cascade='all, delete')
 
+    @classmethod
+    def with_recipe_counts(cls, user_id):
+        '''A user's boards and how many recipes each has, as (board, count) pairs, with one query'''
+
+        return (db.session.query(cls, db.func.count(Recipe.unique_id))
+                .outerjoin(Recipe, Recipe.board_id == cls.id)
+                .filter(cls.user_id == user_id)
+                .group_by(cls.id)
+                .order_by(cls.id)
+                .all())
+
 
 class UserRecipe(db.Model):
     '''Create new recipes and store them as recipes specifically made by users'''
@@ -79,27 +93,149 @@ class UserRecipe(db.Model):
     title = db.Column(db.Text, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete='CASCADE'), nullable=False)
     image = db.Column(db.Text, default='https://spoonacular.com/recipeImages/621204-556x370.jpg')
-    ingredient_1 = db.Column(db.Text, nullable=False)
-    ingredient_2 = db.Column(db.Text, nullable=False)
-    ingredient_3 = db.Column(db.Text)
-    ingredient_4 = db.Column(db.Text)
-    ingredient_5 = db.Column(db.Text)
-    ingredient_6 = db.Column(db.Text)
-    ingredient_7 = db.Column(db.Text)
-    ingredient_8 = db.Column(db.Text)
-    ingredient_9 = db.Column(db.Text)
-    ingredient_10 = db.Column(db.Text)
-    ingredient_11 = db.Column(db.Text)
-    ingredient_12 = db.Column(db.Text)
-    ingredient_13 = db.Column(db.Text)
-    ingredient_14 = db.Column(db.Text)
-    ingredient_15 = db.Column(db.Text)
-    ingredient_16 = db.Column(db.Text)
-    ingredient_17 = db.Column(db.Text)
-    ingredient_18 = db.Column(db.Text)
-    ingredient_19 = db.Column(db.Text)
-    ingredient_20 = db.Column(db.Text)
     instructions = db.Column(db.Text)
+    # full text search over the title, ingredients and instructions, kept up to date on every save
+    search_vector = db.Column(TSVECTOR)
+
+    __table_args__ = (
+        db.Index('ix_user_recipes_search_vector', 'search_vector', postgresql_using='gin'),
+    )
+
+    ingredients = db.relationship('RecipeIngredient', order_by='RecipeIngredient.position',
+                                  cascade='all, delete-orphan', backref='recipe')
+
+    def ingredient_list(self):
+        '''All ingredients of the recipe as written, in order'''
+
+        return [ingredient.original for ingredient in self.ingredients]
+
+    @classmethod
+    def filter_ingredients(cls, query, include=(), exclude=()):
+        '''Limit a query to recipes that have every ingredient in include and none in exclude,
+        e.g. include=['chicken'], exclude=['peanuts']. Uses the ingredient name index.'''
+
+        for name in include:
+            query = query.filter(cls.id.in_(RecipeIngredient.recipe_ids_matching(name)))
+        for name in exclude:
+            query = query.filter(~cls.id.in_(RecipeIngredient.recipe_ids_matching(name)))
+        return query
+
+    @classmethod
+    def with_ingredients(cls, include=(), exclude=(), offset=0, limit=20):
+        '''Recipes that have every ingredient in include and none in exclude, newest first'''
+
+        query = cls.filter_ingredients(cls.query, include, exclude)
+        return query.order_by(cls.id.desc()).offset(offset).limit(limit).all()
+
+    @classmethod
+    def search(cls, query, offset=0, limit=20, exclude_ingredients=()):
+        '''Find recipes matching every word in query (also as a prefix, so "chick" finds "chicken").
+        Results are ranked with title matches first and only limit rows are loaded.
+        Recipes with any of exclude_ingredients are left out.'''
+
+        words = re.findall(r'\w+', query.lower())
+        if not words:
+            return []
+
+        ts_query = db.func.to_tsquery('english', ' & '.join(f'{word}:*' for word in words))
+        search_query = cls.query.filter(cls.search_vector.op('@@')(ts_query))
+        return (cls.filter_ingredients(search_query, exclude=exclude_ingredients)
+                .order_by(db.func.ts_rank(cls.search_vector, ts_query).desc(), cls.id)
+                .offset(offset)
+                .limit(limit)
+                .all())
+
+
+def search_vector_for(title, ingredients, instructions):
+    '''SQL expression for a recipe's search vector. Title words rank highest, then ingredients.'''
+
+    def weighted(text, weight):
+        return db.func.setweight(db.func.to_tsvector('english', text or ''), weight)
+
+    return (weighted(title, 'A')
+            .op('||')(weighted(' '.join(filter(None, ingredients)), 'B'))
+            .op('||')(weighted(instructions, 'C')))
+
+
+# amounts and units left off the front of an ingredient to get its name, e.g. "1/2 cup Milk" -> "milk"
+INGREDIENT_AMOUNT = re.compile(r'^[\d\s/.,½⅓⅔¼¾⅛-]*')
+INGREDIENT_UNITS = {
+    'cup', 'cups', 'c', 'tablespoon', 'tablespoons', 'tbsp', 'tbsps', 'tbs', 'teaspoon', 'teaspoons',
+    'tsp', 'tsps', 'ounce', 'ounces', 'oz', 'pound', 'pounds', 'lb', 'lbs', 'g', 'gram', 'grams',
+    'kg', 'ml', 'l', 'liter', 'liters', 'litre', 'litres', 'quart', 'quarts', 'qt', 'pint', 'pints',
+    'pinch', 'pinches', 'dash', 'dashes', 'can', 'cans', 'package', 'packages', 'pkg', 'stick',
+    'sticks', 'slice', 'slices', 'clove', 'cloves', 'large', 'medium', 'small', 'of',
+}
+
+
+def normalize_ingredient(text):
+    '''Name of an ingredient without its amount and unit, lower cased'''
+
+    words = INGREDIENT_AMOUNT.sub('', text.lower()).split()
+    while len(words) > 1 and words[0].strip('.') in INGREDIENT_UNITS:
+        words.pop(0)
+    return ' '.join(words)
+
+
+class RecipeIngredient(db.Model):
+    '''One ingredient of a user recipe. The name is the ingredient without its amount
+    and unit, and has a full text index so recipes can be found by ingredient.'''
+
+    __tablename__ = 'user_recipe_ingredients'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipe_id = db.Column(db.Integer, db.ForeignKey("user_recipes.id", ondelete='CASCADE'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)
+    original = db.Column(db.Text, nullable=False)
+    name = db.Column(db.Text, nullable=False)
+
+    @classmethod
+    def from_list(cls, texts):
+        '''Ingredients for a recipe from the lines a user typed in, skipping empty ones'''
+
+        texts = [text.strip() for text in texts if text and text.strip()]
+        return [cls(position=position, original=text, name=normalize_ingredient(text))
+                for position, text in enumerate(texts)]
+
+    @classmethod
+    def recipe_ids_matching(cls, name):
+        '''Subquery of the ids of recipes with an ingredient matching name ("peanut" matches "peanuts")'''
+
+        ts_query = db.func.plainto_tsquery('english', name)
+        return db.session.query(cls.recipe_id).filter(db.func.to_tsvector('english', cls.name).op('@@')(ts_query))
+
+
+# inverted index from ingredient words to the recipes using them
+db.Index('ix_user_recipe_ingredients_name', db.func.to_tsvector('english', RecipeIngredient.name), postgresql_using='gin')
+
+
+def saved_ingredients(session, recipe):
+    '''The ingredients a recipe will have once the session is flushed, as written, in order'''
+
+    ingredients = [ingredient for ingredient in recipe.ingredients if ingredient not in session.deleted]
+    if recipe.id is not None:
+        # ingredients added by recipe_id aren't in the collection yet
+        ingredients += [obj for obj in session.new if isinstance(obj, RecipeIngredient)
+                        and obj.recipe_id == recipe.id and obj not in ingredients]
+    return [ingredient.original for ingredient in sorted(ingredients, key=lambda ingredient: ingredient.position)]
+
+
+@event.listens_for(db.session, 'before_flush')
+def update_search_vectors(session, flush_context, instances):
+    '''Recompute the search vector of every user recipe being saved, or whose ingredients
+    were added, changed or deleted'''
+
+    recipes = {obj for obj in chain(session.new, session.dirty) if isinstance(obj, UserRecipe)}
+    with session.no_autoflush:
+        for obj in chain(session.new, session.dirty, session.deleted):
+            if isinstance(obj, RecipeIngredient):
+                recipe = obj.recipe or (obj.recipe_id and session.query(UserRecipe).get(obj.recipe_id))
+                if recipe is not None and recipe not in session.deleted:
+                    recipes.add(recipe)
+
+        for recipe in recipes:
+            recipe.search_vector = search_vector_for(recipe.title, saved_ingredients(session, recipe),
+                                                     recipe.instructions)
 
 
 class Recipe(db.Model):
@@ -111,6 +247,82 @@ class Recipe(db.Model):
     unique_id = db.Column(db.Integer, primary_key=True)
     board_id = db.Column(db.Integer, db.ForeignKey("boards.id", ondelete='CASCADE'))
     id = db.Column(db.Integer)
+    # what a board card needs, copied from the recipe so boards render without calling the API.
+    # refreshed_at is empty until the summary has been filled in (see recipe_summaries.py), and
+    # refresh_failed_at is when loading the recipe for its summary last failed
+    title = db.Column(db.Text)
+    image = db.Column(db.Text)
+    source = db.Column(db.String(20))
+    refreshed_at = db.Column(db.DateTime, index=True)
+    refresh_failed_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.UniqueConstraint('board_id', 'id', name='uq_recipe_board_id_id'),
+    )
+
+    @classmethod
+    def add_to_board(cls, board_id, recipe_id, summary=None):
+        '''Save a recipe to a board unless it is already there. Returns True if it was added.'''
+
+        summaries = {recipe_id: summary} if summary else None
+        return cls.add_many_to_board(board_id, [recipe_id], summaries) == 1
+
+    @classmethod
+    def add_many_to_board(cls, board_id, recipe_ids, summaries=None):
+        '''Save many recipes to a board with one statement, skipping any already there.
+        summaries can map recipe ids to their {title, image, source}. Returns how many were added.'''
+
+        recipe_ids = list(dict.fromkeys(recipe_ids))
+        if not recipe_ids:
+            return 0
+
+        summaries = summaries or {}
+        now = datetime.utcnow()
+        rows = []
+        for recipe_id in recipe_ids:
+            row = {'board_id': board_id, 'id': recipe_id, 'title': None, 'image': None, 'source': None, 'refreshed_at': None}
+            if recipe_id in summaries:
+                row.update(summaries[recipe_id], refreshed_at=now)
+            rows.append(row)
+
+        stmt = (insert(cls.__table__)
+                .values(rows)
+                .on_conflict_do_nothing(index_elements=['board_id', 'id']))
+        return db.session.execute(stmt).rowcount
+
+    @classmethod
+    def update_summaries(cls, summaries):
+        '''Store fresh {title, image, source} summaries, given as a dict of recipe id -> summary,
+        on every board the recipes are saved to'''
+
+        now = datetime.utcnow()
+        for recipe_id, summary in summaries.items():
+            cls.query.filter(cls.id == recipe_id).update(dict(summary, refreshed_at=now, refresh_failed_at=None),
+                                                          synchronize_session='evaluate')
+
+
+class RecipeCache(db.Model):
+    '''Saved copy of the information Spoonacular returns for a recipe, so pages
+    can be shown again without calling the API. See recipe_cache.py.'''
+
+    __tablename__ = 'recipe_cache'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    data = db.Column(db.JSON, nullable=False)
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class PoolRecipe(db.Model):
+    '''Random recipes kept for the homepage, so it doesn't call the API on every visit.
+    Only what the homepage cards need is stored here. See recipe_pool.py.'''
+
+    __tablename__ = 'random_recipe_pool'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.Text, nullable=False)
+    image = db.Column(db.Text)
+    added_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
 
 
 def connect_db(app):
@@ -0,0 +1,85 @@
+'''HTTP caching of recipe pages and a cache of rendered recipe cards.
+
+Recipe pages get an ETag made from the recipe's content, the logged in user
+(the navbar depends on it) and the templates. A browser that already has that
+version sends it back in If-None-Match and gets an empty 304 instead of the page,
+without the template being rendered at all.
+
+Cards in the home, search and board grids are rendered once per recipe version
+and reused from an in-process LRU afterwards. A card's key is the fields it
+shows, so editing a recipe gives it a new key.
+'''
+
+import hashlib
+import json
+import os
+
+from flask import Markup, g, make_response, render_template, request, session
+
+from recipe_cache import LRUCache
+
+
+def templates_version(app):
+    '''Hash of every template, so ETags change whenever a template does'''
+
+    digest = hashlib.sha1()
+    for root, dirs, files in sorted(os.walk(os.path.join(app.root_path, app.template_folder))):
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+class PageCache:
+    '''Conditional responses for pages and the recipe_card template global'''
+
+    def __init__(self, app=None):
+        self.cards = LRUCache(5000)
+        self.version = ''
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Read cache settings from the app config and add the recipe_card template global'''
+
+        self.cards = LRUCache(app.config.setdefault('CARD_CACHE_SIZE', 5000))
+        self.version = templates_version(app)
+        app.add_template_global(self.recipe_card, 'recipe_card')
+
+    def etag(self, content):
+        '''ETag of a page showing content (anything json can encode) to the current user'''
+
+        user_id = g.user.id if g.get('user') else None
+        raw = json.dumps([self.version, user_id, content], sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def render(self, content, template, **context):
+        '''Render template, or answer 304 if the browser already has this version of it.
+        content is what the page shows, and is only used to build the ETag.'''
+
+        etag = self.etag(content)
+
+        # flashed messages are shown once, so a page with some pending must be rendered
+        if '_flashes' not in session and request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(render_template(template, **context))
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+        return response
+
+    def recipe_card(self, recipe):
+        '''Rendered card for a recipe dict or object in one of the grids'''
+
+        if isinstance(recipe, dict):
+            key = (recipe.get('id'), recipe.get('title'), recipe.get('image'))
+        else:
+            key = (recipe.id, recipe.title, recipe.image)
+
+        card = self.cards.get(key)
+        if card is None:
+            card = Markup(render_template('recipes/card.html', recipe=recipe))
+            self.cards.set(key, card)
+        return card
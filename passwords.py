@@ -0,0 +1,113 @@
+'''Password hashing on a pool of worker processes.
+
+bcrypt is slow on purpose, and hashing in the request would keep a worker busy
+for the whole hash while every other route waits behind it. PasswordHasher sends
+the hashing to a small process pool instead, and only lets so many hashes wait
+for it: past that, callers get PasswordHasherBusy right away rather than piling
+up behind a login storm.
+
+Settings are read from the app config by init_app:
+
+    BCRYPT_LOG_ROUNDS           bcrypt work factor; stored hashes with another one are redone on login
+    PASSWORD_WORKERS            processes in the pool, 0 hashes in the calling thread
+    PASSWORD_MAX_PENDING        hashes running or waiting at once, past which callers are turned away
+    PASSWORD_ADMISSION_TIMEOUT  seconds a caller waits for a free slot before being turned away
+'''
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+
+class PasswordHasherBusy(Exception):
+    '''Too many passwords are being hashed already, try again later'''
+
+
+def hash_password(password, rounds):
+    '''bcrypt hash of password as a string'''
+
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def check_password(hashed, password):
+    '''Check if password matches a bcrypt hash'''
+
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    except ValueError:
+        return False
+
+
+def hash_rounds(hashed):
+    '''The work factor a bcrypt hash was made with, e.g. 12 for "$2b$12$..."'''
+
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    '''Hashes and checks passwords on a bounded process pool'''
+
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.workers = os.cpu_count() or 1
+        self.pending = threading.BoundedSemaphore(self.workers * 4)
+        self.admission_timeout = 1.0
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Read hashing settings from the app config'''
+
+        self.rounds = app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        self.workers = app.config.setdefault('PASSWORD_WORKERS', os.cpu_count() or 1)
+        self.pending = threading.BoundedSemaphore(app.config.setdefault('PASSWORD_MAX_PENDING',
+                                                                        max(self.workers, 1) * 4))
+        self.admission_timeout = app.config.setdefault('PASSWORD_ADMISSION_TIMEOUT', 1.0)
+
+    def get_pool(self):
+        '''The process pool, started the first time a password is hashed'''
+
+        with self.pool_lock:
+            if self.pool is None:
+                # spawn rather than fork, so workers don't inherit database connections or locks held by other threads
+                self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+            return self.pool
+
+    def run(self, fn, *args):
+        '''Run fn(*args) on the pool and wait for it. Raises PasswordHasherBusy if too much is queued.'''
+
+        if not self.pending.acquire(timeout=self.admission_timeout):
+            raise PasswordHasherBusy()
+        try:
+            if not self.workers:
+                return fn(*args)
+            return self.get_pool().submit(fn, *args).result()
+        finally:
+            self.pending.release()
+
+    def hash(self, password):
+        '''Hash a password with the configured work factor'''
+
+        return self.run(hash_password, password, self.rounds)
+
+    def check(self, hashed, password):
+        '''Check if password matches hashed'''
+
+        return self.run(check_password, hashed, password)
+
+    def needs_rehash(self, hashed):
+        '''Check if hashed was made with a different work factor than the configured one'''
+
+        return hash_rounds(hashed) != self.rounds
+
+
+hasher = PasswordHasher()
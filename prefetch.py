@@ -0,0 +1,108 @@
+'''Fetching the recipes people are about to click before they click them.
+
+Most visitors to a search or the homepage open one of the first few cards, and
+that click then waits for Spoonacular. When PREFETCH_ENABLED is set, the ids of
+the first PREFETCH_TOP_N results are handed to a background thread once the
+page has been sent. The thread fetches the ones that aren't cached yet with one
+bulk call and stores them in the recipe cache, so the click is served warm.
+
+Prefetching spends quota on recipes nobody may open, so it is limited to
+PREFETCH_BUDGET points an hour and runs at background priority. get_stats
+reports how many prefetched recipes were then viewed (the hit rate) and the
+points spent on the ones that weren't.
+'''
+
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from quota import priority, BACKGROUND
+from recipe_cache import LRUCache
+from spoonacular import estimated_points
+
+
+class Prefetcher:
+    '''Warms the recipe cache with the top results of a page, within an hourly budget of points'''
+
+    def __init__(self, recipe_cache, fetch_many, app=None):
+        self.recipe_cache = recipe_cache
+        self.fetch_many = fetch_many
+        self.enabled = False
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        # prefetched recipes nobody has viewed yet
+        self.unviewed = LRUCache(10000)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Read prefetch settings from the app config'''
+
+        self.app = app
+        self.enabled = app.config.setdefault('PREFETCH_ENABLED', False)
+        self.top_n = app.config.setdefault('PREFETCH_TOP_N', 6)
+        self.budget = app.config.setdefault('PREFETCH_BUDGET', 20)
+        self.points = float(self.budget)
+        self.refilled_at = time.monotonic()
+
+    def after_response(self, response, recipe_ids):
+        '''Prefetch the first recipe_ids once response has been sent. Returns response.'''
+
+        if self.enabled:
+            recipe_ids = list(recipe_ids)[:self.top_n]
+            response.call_on_close(lambda: self.executor.submit(self.prefetch, recipe_ids))
+        return response
+
+    def take_points(self, cost):
+        '''Take cost points from the hourly budget, if there are enough'''
+
+        with self.lock:
+            now = time.monotonic()
+            self.points = min(self.budget, self.points + (now - self.refilled_at) * self.budget / 3600)
+            self.refilled_at = now
+            if self.points < cost:
+                return False
+            self.points -= cost
+            return True
+
+    def prefetch(self, recipe_ids):
+        try:
+            with self.app.app_context(), priority(BACKGROUND):
+                recipe_ids = self.recipe_cache.uncached(recipe_ids)
+                if not recipe_ids:
+                    return
+
+                cost = estimated_points('/recipes/informationBulk', {'ids': ','.join(map(str, recipe_ids))})
+                if not self.take_points(cost):
+                    self.stats['over_budget'] += len(recipe_ids)
+                    return
+
+                fetched = self.fetch_many(recipe_ids)
+                self.recipe_cache.store(fetched)
+                self.stats['prefetched'] += len(fetched)
+                self.stats['points'] += cost
+                for recipe_id in fetched:
+                    self.unviewed.set(recipe_id, True)
+        except Exception:
+            self.app.logger.exception("Prefetch failed for recipes %s", recipe_ids)
+
+    def record_view(self, recipe_id):
+        '''Count a view of a recipe, which is a hit if it was prefetched and not viewed since'''
+
+        if self.unviewed.get(recipe_id):
+            self.unviewed.delete(recipe_id)
+            self.stats['hits'] += 1
+
+    def get_stats(self):
+        '''Recipes prefetched and viewed, the hit rate and the points spent on recipes nobody viewed'''
+
+        prefetched = self.stats['prefetched']
+        hit_rate = self.stats['hits'] / prefetched if prefetched else 0.0
+        return {
+            **self.stats,
+            'hit_rate': hit_rate,
+            'wasted_points': round(self.stats['points'] * (1 - hit_rate), 2),
+            'budget_left': round(self.points, 2),
+        }
@@ -0,0 +1,74 @@
+'''Trimmed JSON views of recipes and boards for the /api/v1 routes.
+
+A Spoonacular recipe is tens of kilobytes of nutrition, wine pairings and
+analyzed steps, of which a card shows three fields and a recipe page a handful
+more. The functions here pick out only those fields, for Spoonacular recipe
+dicts, UserRecipe rows and saved Recipe rows alike.
+
+stream_json writes a JSON object holding one long list a few kilobytes at a
+time, so a board with thousands of recipes is never built up in memory.
+'''
+
+import json
+
+from models import UserRecipe
+
+# roughly how many characters stream_json sends at a time
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def dumps(data):
+    return json.dumps(data, separators=(',', ':'))
+
+
+def card(recipe, thumbnail):
+    '''The fields a recipe card shows, for a recipe dict or object. thumbnail(image) is the card image's url.'''
+
+    if isinstance(recipe, dict):
+        recipe_id, title, image = recipe['id'], recipe.get('title'), recipe.get('image')
+    else:
+        recipe_id, title, image = recipe.id, recipe.title, recipe.image
+    return {'id': recipe_id, 'title': title, 'image': image, 'thumbnail': thumbnail(image)}
+
+
+def detail(recipe):
+    '''The fields a recipe page shows, for a UserRecipe or a Spoonacular recipe dict'''
+
+    if isinstance(recipe, UserRecipe):
+        return {'id': recipe.id, 'title': recipe.title, 'image': recipe.image, 'source': 'user',
+                'ingredients': recipe.ingredient_list(), 'instructions': recipe.instructions,
+                'source_url': None, 'ready_in_minutes': None, 'servings': None}
+    return {'id': recipe['id'], 'title': recipe['title'], 'image': recipe.get('image'), 'source': 'spoonacular',
+            'ingredients': [ingredient.get('original') for ingredient in recipe.get('extendedIngredients') or []],
+            'instructions': recipe.get('instructions'), 'source_url': recipe.get('sourceUrl'),
+            'ready_in_minutes': recipe.get('readyInMinutes'), 'servings': recipe.get('servings')}
+
+
+def board(board, recipe_count=None):
+    '''A board's id, name and owner, and how many recipes it has if that is known'''
+
+    data = {'id': board.id, 'name': board.name, 'user_id': board.user_id}
+    if recipe_count is not None:
+        data['recipe_count'] = recipe_count
+    return data
+
+
+def stream_json(head, key, items):
+    '''Yield the JSON of the dict head with key added to it, holding the list of items.
+    Items are encoded one at a time and sent in chunks of about STREAM_CHUNK_SIZE characters.'''
+
+    opening = dumps(head)[:-1]
+    parts = [f'{opening}{"," if head else ""}{dumps(key)}:[']
+    size = len(parts[0])
+    separator = ''
+    for item in items:
+        text = separator + dumps(item)
+        separator = ','
+        parts.append(text)
+        size += len(text)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(parts)
+            parts = []
+            size = 0
+    parts.append(']}')
+    yield ''.join(parts)
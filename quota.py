@@ -0,0 +1,147 @@
+'''Scheduling of outbound Spoonacular calls against the API quota.
+
+Spoonacular charges points for every call, and once the day's points are gone
+every call fails. QuotaScheduler keeps a token bucket of points that refills
+over the day and is corrected from the X-API-Quota-Left header of every
+response. Before a call is sent its estimated cost is taken from the bucket.
+
+Calls belong to one of three priority classes. Interactive calls (recipe pages
+and boards) can spend the bucket down to zero. Search calls stop short of a
+small reserve, and background calls (refreshes, warming, prefetching) stop
+short of a bigger one, so that as points run low the least important calls are
+turned away first. The same order decides who goes first when all of a
+worker's outbound slots are busy.
+
+The class of a call comes from current_priority. Requests set it to
+INTERACTIVE, anything else runs as BACKGROUND unless it says otherwise with
+`with priority(SEARCH):`.
+'''
+
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+INTERACTIVE, SEARCH, BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', SEARCH: 'search', BACKGROUND: 'background'}
+# seconds a call of each class waits for a free slot before giving up
+SLOT_WAIT = {INTERACTIVE: 10, SEARCH: 5, BACKGROUND: 30}
+DAY = 60 * 60 * 24
+
+current_priority = ContextVar('spoonacular_priority', default=BACKGROUND)
+
+
+@contextmanager
+def priority(level):
+    '''Run the calls made inside the block with priority level'''
+
+    token = current_priority.set(level)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+class OutboundRejected(Exception):
+    '''A call was not sent'''
+
+
+class QuotaExceeded(OutboundRejected):
+    '''Not enough quota is left for a call of this priority'''
+
+
+class SchedulerBusy(OutboundRejected):
+    '''No outbound slot came free in time'''
+
+
+class QuotaScheduler:
+    '''Token bucket of API points plus a limit on concurrent calls, both served in priority order'''
+
+    def __init__(self, daily_points=150, max_concurrent=10, search_reserve=0.1, background_reserve=0.3):
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.order = itertools.count()
+        self.active = 0
+        self.stats = Counter()
+        self.configure(daily_points, max_concurrent, search_reserve, background_reserve)
+
+    def configure(self, daily_points, max_concurrent, search_reserve, background_reserve):
+        with self.condition:
+            self.capacity = float(daily_points)
+            self.tokens = self.capacity
+            self.refilled_at = time.monotonic()
+            self.max_concurrent = max_concurrent
+            # points each class leaves in the bucket for the classes above it
+            self.reserves = {INTERACTIVE: 0.0, SEARCH: search_reserve * self.capacity,
+                             BACKGROUND: background_reserve * self.capacity}
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.refilled_at) * self.capacity / DAY)
+        self.refilled_at = now
+
+    @contextmanager
+    def slot(self, cost):
+        '''Take cost points and an outbound slot for the duration of the block.
+        Raises QuotaExceeded or SchedulerBusy if the call should not be sent.'''
+
+        level = current_priority.get()
+        name = PRIORITY_NAMES[level]
+        with self.condition:
+            self.refill()
+            if self.tokens - cost < self.reserves[level]:
+                self.stats[f'{name}_over_quota'] += 1
+                raise QuotaExceeded(f'{self.tokens:.1f} points left, not enough for a {name} call')
+            self.tokens -= cost
+
+            entry = (level, next(self.order))
+            heapq.heappush(self.waiting, entry)
+            deadline = time.monotonic() + SLOT_WAIT[level]
+            while self.active >= self.max_concurrent or self.waiting[0] != entry:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.waiting.remove(entry)
+                    heapq.heapify(self.waiting)
+                    self.tokens += cost
+                    self.stats[f'{name}_busy'] += 1
+                    self.condition.notify_all()
+                    raise SchedulerBusy(f'No outbound slot for a {name} call')
+                self.condition.wait(remaining)
+            heapq.heappop(self.waiting)
+            self.active += 1
+            self.stats[f'{name}_sent'] += 1
+            # the next in line may be able to go too
+            self.condition.notify_all()
+
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active -= 1
+                self.condition.notify_all()
+
+    def update(self, headers, status_code=200):
+        '''Correct the bucket from a response's quota headers. A 402 means the quota is used up.'''
+
+        with self.condition:
+            if status_code == 402:
+                self.tokens = 0.0
+            elif 'X-API-Quota-Left' in headers:
+                try:
+                    self.tokens = min(self.capacity, max(0.0, float(headers['X-API-Quota-Left'])))
+                except ValueError:
+                    return
+            else:
+                return
+            self.refilled_at = time.monotonic()
+
+    def get_stats(self):
+        '''Points left, calls in flight and how many calls of each class were sent or turned away'''
+
+        with self.condition:
+            self.refill()
+            return {**self.stats, 'points_left': round(self.tokens, 2), 'active': self.active,
+                    'waiting': len(self.waiting)}
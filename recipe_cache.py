@@ -0,0 +1,290 @@
+'''Cache for the recipe information we get from Spoonacular.
+
+There are two layers. A small in-process LRU answers the most common recipes
+without any I/O, and the recipe_cache table keeps every recipe we have fetched
+so other workers (and restarts) can reuse it.
+
+Entries younger than RECIPE_CACHE_TTL are served as they are. Older entries are
+still served until RECIPE_CACHE_STALE_TTL runs out, but a refresh is started in
+the background so the next visitor gets fresh data.
+
+When RECIPE_CACHE_LEASE_DIR is set, a worker fetching a recipe nobody has cached
+holds a lease on it (see singleflight.py). Other workers on the machine wanting
+the same recipe wait for the lease and then read it from the table instead of
+calling the API again.
+
+Reads record when a recipe was last used, for evicting rows, at most once per
+RECIPE_CACHE_TOUCH_INTERVAL per recipe and worker. Every write to the table
+(storing, touching and evicting) runs in a transaction of its own, so using the
+cache never flushes or commits the caller's session.
+'''
+
+import os
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, RecipeCache
+from singleflight import FileLease
+
+
+class LRUCache:
+    '''Thread safe least recently used cache with a fixed number of entries'''
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class RecipeDetailCache:
+    '''Read-through cache of Spoonacular recipe information.
+
+    fetch_one(recipe_id) returns a recipe dict or None, and fetch_many(recipe_ids)
+    returns a dict of recipe id -> recipe dict for the ids it could load.'''
+
+    def __init__(self, fetch_one, fetch_many, app=None):
+        self.fetch_one = fetch_one
+        self.fetch_many = fetch_many
+        self.stats = Counter()
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        # entries are (recipe, fetched_at, when last_used_at was last set)
+        self.memory = LRUCache(500)
+        self.writes = 0
+        self.lease_dir = None
+        self.touch_interval = timedelta(hours=1)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Read cache settings from the app config'''
+
+        self.app = app
+        self.ttl = timedelta(seconds=app.config.setdefault('RECIPE_CACHE_TTL', 60 * 60 * 24))
+        self.stale_ttl = timedelta(seconds=app.config.setdefault('RECIPE_CACHE_STALE_TTL', 60 * 60 * 24 * 7))
+        self.max_rows = app.config.setdefault('RECIPE_CACHE_MAX_ROWS', 50000)
+        self.memory = LRUCache(app.config.setdefault('RECIPE_CACHE_MEMORY_SIZE', 500))
+        self.lease_dir = app.config.setdefault('RECIPE_CACHE_LEASE_DIR', None)
+        self.touch_interval = timedelta(seconds=app.config.setdefault('RECIPE_CACHE_TOUCH_INTERVAL', 60 * 60))
+        if self.lease_dir:
+            os.makedirs(self.lease_dir, exist_ok=True)
+
+    def get(self, recipe_id):
+        '''Get one recipe, calling the API only when we have nothing usable'''
+
+        return self.get_many([recipe_id]).get(recipe_id)
+
+    def get_many(self, recipe_ids):
+        '''Get many recipes as a dict of recipe id -> recipe. Ids that are missing
+        from both layers are fetched together with one call to fetch_many.'''
+
+        now = datetime.utcnow()
+        found = {}
+        stale = []
+        missing = []
+        touch = []
+
+        for recipe_id in recipe_ids:
+            entry = self.memory.get(recipe_id)
+            if entry is None:
+                missing.append(recipe_id)
+            elif now - entry[1] < self.ttl:
+                found[recipe_id] = entry[0]
+                self.stats['memory_hits'] += 1
+                if now - entry[2] >= self.touch_interval:
+                    touch.append(recipe_id)
+                    self.memory.set(recipe_id, (entry[0], entry[1], now))
+            else:
+                missing.append(recipe_id)
+
+        if missing:
+            rows = RecipeCache.query.filter(RecipeCache.id.in_(missing)).all()
+            for row in rows:
+                age = now - row.fetched_at
+                if age < self.ttl:
+                    self.stats['db_hits'] += 1
+                elif age < self.ttl + self.stale_ttl:
+                    self.stats['stale_hits'] += 1
+                    stale.append(row.id)
+                else:
+                    continue
+                found[row.id] = row.data
+                if now - row.last_used_at >= self.touch_interval:
+                    touch.append(row.id)
+                    self.memory.set(row.id, (row.data, row.fetched_at, now))
+                else:
+                    self.memory.set(row.id, (row.data, row.fetched_at, row.last_used_at))
+
+        if touch:
+            self.touch(touch, now)
+
+        to_fetch = [recipe_id for recipe_id in missing if recipe_id not in found]
+        if to_fetch:
+            self.stats['misses'] += len(to_fetch)
+            if len(to_fetch) == 1:
+                fetched = self.fetch_single(to_fetch[0])
+            else:
+                fetched = self.fetch_many(to_fetch)
+                self.store(fetched)
+            found.update(fetched)
+            found.update(self.expired(set(to_fetch) - set(fetched)))
+
+        if stale:
+            self.refresh_later(stale)
+
+        return found
+
+    def touch(self, recipe_ids, now):
+        '''Set last_used_at on rows not touched for RECIPE_CACHE_TOUCH_INTERVAL,
+        in a transaction of its own'''
+
+        table = RecipeCache.__table__
+        with db.engine.begin() as conn:
+            conn.execute(table.update()
+                         .where(table.c.id.in_(recipe_ids))
+                         .where(table.c.last_used_at < now - self.touch_interval)
+                         .values(last_used_at=now))
+
+    def uncached(self, recipe_ids):
+        '''The recipe ids that have no fresh entry in either layer'''
+
+        now = datetime.utcnow()
+        missing = []
+        for recipe_id in recipe_ids:
+            entry = self.memory.get(recipe_id)
+            if entry is None or now - entry[1] >= self.ttl:
+                missing.append(recipe_id)
+        if not missing:
+            return []
+
+        fresh = {recipe_id for recipe_id, in db.session.query(RecipeCache.id)
+                 .filter(RecipeCache.id.in_(missing), RecipeCache.fetched_at > now - self.ttl)}
+        return [recipe_id for recipe_id in missing if recipe_id not in fresh]
+
+    def fetch_single(self, recipe_id):
+        '''Fetch and store one recipe, as a dict that is empty if it couldn't be fetched.
+        With a lease directory only one worker process fetches a recipe at a time, and
+        the ones that waited for it read what it stored.'''
+
+        if not self.lease_dir:
+            return self.fetch_and_store(recipe_id)
+
+        with FileLease(self.lease_dir, ('recipe', recipe_id)):
+            row = RecipeCache.query.filter_by(id=recipe_id).populate_existing().first()
+            if row is not None and datetime.utcnow() - row.fetched_at < self.ttl:
+                self.stats['lease_hits'] += 1
+                self.memory.set(row.id, (row.data, row.fetched_at, row.last_used_at))
+                return {row.id: row.data}
+            return self.fetch_and_store(recipe_id)
+
+    def fetch_and_store(self, recipe_id):
+        recipe = self.fetch_one(recipe_id)
+        fetched = {recipe_id: recipe} if recipe else {}
+        self.store(fetched)
+        return fetched
+
+    def expired(self, recipe_ids):
+        '''Fall back to expired rows for recipes the API could not give us'''
+
+        if not recipe_ids:
+            return {}
+        rows = RecipeCache.query.filter(RecipeCache.id.in_(recipe_ids)).all()
+        return {row.id: row.data for row in rows}
+
+    def store(self, recipes):
+        '''Save freshly fetched recipes in both layers'''
+
+        if not recipes:
+            return
+
+        now = datetime.utcnow()
+        for recipe_id, recipe in recipes.items():
+            self.memory.set(recipe_id, (recipe, now, now))
+
+        stmt = insert(RecipeCache.__table__).values([
+            {'id': recipe_id, 'data': recipe, 'fetched_at': now, 'last_used_at': now}
+            for recipe_id, recipe in recipes.items()
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['id'],
+            set_={'data': stmt.excluded.data, 'fetched_at': now, 'last_used_at': now}
+        )
+        with db.engine.begin() as conn:
+            conn.execute(stmt)
+
+        self.writes += len(recipes)
+        if self.writes >= 100:
+            self.writes = 0
+            self.evict()
+
+    def evict(self):
+        '''Delete the least recently used rows once the table is over RECIPE_CACHE_MAX_ROWS'''
+
+        table = RecipeCache.__table__
+        with db.engine.begin() as conn:
+            cutoff = conn.execute(db.select([table.c.last_used_at])
+                                  .order_by(table.c.last_used_at.desc())
+                                  .offset(self.max_rows).limit(1)).scalar()
+            if cutoff is not None:
+                conn.execute(table.delete().where(table.c.last_used_at <= cutoff))
+
+    def refresh_later(self, recipe_ids):
+        '''Refetch stale recipes in the background, once per recipe at a time'''
+
+        with self.lock:
+            recipe_ids = [recipe_id for recipe_id in recipe_ids if recipe_id not in self.refreshing]
+            self.refreshing.update(recipe_ids)
+        if recipe_ids:
+            self.executor.submit(self.refresh, recipe_ids)
+
+    def refresh(self, recipe_ids):
+        try:
+            with self.app.app_context():
+                self.store(self.fetch_many(recipe_ids))
+                self.stats['refreshes'] += len(recipe_ids)
+        except Exception:
+            self.app.logger.exception("Background refresh failed for recipes %s", recipe_ids)
+        finally:
+            with self.lock:
+                self.refreshing.difference_update(recipe_ids)
+
+    def get_stats(self):
+        '''Hit and miss counters, plus how full the memory layer is'''
+
+        hits = self.stats['memory_hits'] + self.stats['db_hits'] + self.stats['stale_hits']
+        lookups = hits + self.stats['misses']
+        return {
+            **self.stats,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'memory_entries': len(self.memory),
+        }
@@ -0,0 +1,127 @@
+'''Pool of random recipes for the homepage.
+
+The homepage used to ask Spoonacular for 100 random recipes on every visit.
+Now a pool of RANDOM_POOL_SIZE recipes is kept in the random_recipe_pool table
+and in memory, and every visit just samples from the copy in memory.
+
+A background thread tops the pool up with RANDOM_POOL_BATCH new recipes every
+RANDOM_POOL_REFRESH seconds and drops the oldest ones. Workers share the table,
+and a refresh holds a Postgres advisory lock, so only one of them calls the API
+per interval and the others wait for it and reload from the table.
+
+While the pool is empty, because the first fetch failed, the thread tries again
+every RANDOM_POOL_RETRY seconds instead of leaving the homepage empty until the
+next refresh.
+'''
+
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from models import db, PoolRecipe
+
+# advisory lock held by the worker refreshing the pool
+REFRESH_LOCK = 0x5eed
+
+
+class RandomRecipePool:
+    '''In-memory sample of random recipes, backed by the random_recipe_pool table.
+
+    fetch_random(number) returns a list of Spoonacular recipe dicts, and
+    on_fetched(recipes) (optional) is given each fresh batch, which lets the
+    caller warm other caches with the full payloads.'''
+
+    def __init__(self, fetch_random, on_fetched=None, app=None):
+        self.fetch_random = fetch_random
+        self.on_fetched = on_fetched
+        self.recipes = ()
+        self.lock = threading.Lock()
+        self.thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Read pool settings from the app config and warm the pool before the first request'''
+
+        self.app = app
+        self.size = app.config.setdefault('RANDOM_POOL_SIZE', 300)
+        self.batch = app.config.setdefault('RANDOM_POOL_BATCH', 100)
+        self.interval = app.config.setdefault('RANDOM_POOL_REFRESH', 15 * 60)
+        self.retry = app.config.setdefault('RANDOM_POOL_RETRY', 30)
+        self.background = app.config.setdefault('RANDOM_POOL_BACKGROUND', True)
+        app.before_first_request(self.warm_up)
+
+    def sample(self, number):
+        '''Pick number random recipes from the pool without any I/O'''
+
+        recipes = self.recipes
+        return random.sample(recipes, min(number, len(recipes)))
+
+    def warm_up(self):
+        '''Fill the pool from the table, calling the API only if the table is empty,
+        and start the background refresh'''
+
+        self.load()
+        if not self.recipes:
+            self.refresh()
+
+        if self.background and self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='random-recipe-pool', daemon=True)
+            self.thread.start()
+
+    def load(self):
+        '''Replace the in-memory copy with what is in the table'''
+
+        rows = PoolRecipe.query.order_by(PoolRecipe.added_at.desc()).limit(self.size).all()
+        self.recipes = tuple({'id': row.id, 'title': row.title, 'image': row.image} for row in rows)
+
+    def is_due(self):
+        '''Check if nobody has added to the pool within the refresh interval'''
+
+        newest = db.session.query(db.func.max(PoolRecipe.added_at)).scalar()
+        return newest is None or datetime.utcnow() - newest >= timedelta(seconds=self.interval)
+
+    def refresh(self):
+        '''Add a batch of new random recipes to the table and trim it back to size.
+        Workers refreshing at the same time wait for each other, so only the first
+        calls the API and the rest find its batch in the table.'''
+
+        with self.lock:
+            # held until the commit below
+            db.session.execute(db.select([db.func.pg_advisory_xact_lock(REFRESH_LOCK)]))
+            if not self.is_due():
+                db.session.commit()
+                self.load()
+                return
+
+            recipes = self.fetch_random(self.batch)
+            if recipes:
+                now = datetime.utcnow()
+                for recipe in recipes:
+                    db.session.merge(PoolRecipe(id=recipe['id'], title=recipe['title'], image=recipe.get('image'),
+                                                added_at=now))
+                db.session.flush()
+
+                oldest_kept = (db.session.query(PoolRecipe.added_at)
+                               .order_by(PoolRecipe.added_at.desc())
+                               .offset(self.size - 1).limit(1).scalar())
+                if oldest_kept is not None:
+                    PoolRecipe.query.filter(PoolRecipe.added_at < oldest_kept).delete(synchronize_session=False)
+            db.session.commit()
+
+            if not recipes:
+                return
+            self.load()
+
+        if self.on_fetched:
+            self.on_fetched(recipes)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval if self.recipes else self.retry)
+            try:
+                with self.app.app_context():
+                    self.refresh()
+            except Exception:
+                self.app.logger.exception("Refreshing the random recipe pool failed")
@@ -0,0 +1,121 @@
+'''Summaries of saved recipes, stored on their Recipe rows.
+
+A board card only needs a recipe's title and image, so those are copied onto the
+Recipe row when a recipe is saved to a board, and boards render from one query.
+Rows saved before summaries existed are filled in the first time their board
+is viewed.
+
+A background thread refreshes summaries older than RECIPE_SUMMARY_MAX_AGE seconds,
+RECIPE_SUMMARY_BATCH recipes at a time, every RECIPE_SUMMARY_REFRESH seconds.
+
+A recipe that fails to load keeps the summary it had, or stays without one, and
+is tried again by either path once RECIPE_SUMMARY_RETRY seconds have passed.
+'''
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+from models import db, Recipe, UserRecipe
+
+
+def summarize(recipe):
+    '''The {title, image, source} summary of a UserRecipe or a Spoonacular recipe dict'''
+
+    if isinstance(recipe, UserRecipe):
+        return {'title': recipe.title, 'image': recipe.image, 'source': 'user'}
+    return {'title': recipe['title'], 'image': recipe.get('image'), 'source': 'spoonacular'}
+
+
+class SummaryRefresher:
+    '''Fills in and refreshes recipe summaries.
+
+    load_recipes(recipe_ids) returns a dict of recipe id -> UserRecipe or Spoonacular
+    recipe dict for the ids it could load.'''
+
+    def __init__(self, load_recipes, app=None):
+        self.load_recipes = load_recipes
+        self.thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Read refresh settings from the app config and start refreshing before the first request'''
+
+        self.app = app
+        self.max_age = timedelta(seconds=app.config.setdefault('RECIPE_SUMMARY_MAX_AGE', 60 * 60 * 24 * 7))
+        self.batch = app.config.setdefault('RECIPE_SUMMARY_BATCH', 100)
+        self.interval = app.config.setdefault('RECIPE_SUMMARY_REFRESH', 10 * 60)
+        self.retry_after = timedelta(seconds=app.config.setdefault('RECIPE_SUMMARY_RETRY', 10 * 60))
+        self.background = app.config.setdefault('RECIPE_SUMMARY_BACKGROUND', True)
+        app.before_first_request(self.start)
+
+    def start(self):
+        if self.background and self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='recipe-summaries', daemon=True)
+            self.thread.start()
+
+    def fill_missing(self, board_recipes):
+        '''Fill in the summaries of Recipe rows that don't have one yet. The updates are
+        applied to the rows given too, and the commit leaves them loaded, so the caller
+        can render them without loading each one again.'''
+
+        retry_cutoff = datetime.utcnow() - self.retry_after
+        missing = list(dict.fromkeys(
+            recipe.id for recipe in board_recipes
+            if recipe.refreshed_at is None and (recipe.refresh_failed_at is None or recipe.refresh_failed_at < retry_cutoff)))
+        if not missing:
+            return
+
+        loaded = self.load_recipes(missing)
+        Recipe.update_summaries({recipe_id: summarize(recipe) for recipe_id, recipe in loaded.items()})
+        self.mark_failed([recipe_id for recipe_id in missing if recipe_id not in loaded])
+
+        session = db.session()
+        expire_on_commit, session.expire_on_commit = session.expire_on_commit, False
+        try:
+            session.commit()
+        finally:
+            session.expire_on_commit = expire_on_commit
+
+    def mark_failed(self, recipe_ids):
+        '''Put off trying recipes that could not be loaded again for RECIPE_SUMMARY_RETRY seconds'''
+
+        if recipe_ids:
+            (Recipe.query.filter(Recipe.id.in_(recipe_ids))
+             .update({'refresh_failed_at': datetime.utcnow()}, synchronize_session='fetch'))
+
+    def refresh_stale(self):
+        '''Refresh one batch of the summaries that are out of date. Returns how many were refreshed.'''
+
+        now = datetime.utcnow()
+        cutoff = now - self.max_age
+        stale = (db.session.query(Recipe.id)
+                 .filter(db.or_(Recipe.refreshed_at.is_(None), Recipe.refreshed_at < cutoff))
+                 .filter(db.or_(Recipe.refresh_failed_at.is_(None), Recipe.refresh_failed_at < now - self.retry_after))
+                 .group_by(Recipe.id)
+                 .order_by(db.func.min(Recipe.refreshed_at).asc().nullsfirst())
+                 .limit(self.batch)
+                 .all())
+        if not stale:
+            return 0
+
+        stale_ids = [recipe_id for recipe_id, in stale]
+        loaded = self.load_recipes(stale_ids)
+        Recipe.update_summaries({recipe_id: summarize(recipe) for recipe_id, recipe in loaded.items()})
+
+        # recipes that could not be loaded keep their old summary, or stay without one so boards keep
+        # trying to fill them in, and step out of the queue for a while so they don't hold up the rest
+        self.mark_failed([recipe_id for recipe_id in stale_ids if recipe_id not in loaded])
+
+        db.session.commit()
+        return len(loaded)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    self.refresh_stale()
+            except Exception:
+                self.app.logger.exception("Refreshing recipe summaries failed")
@@ -0,0 +1,373 @@
+'''Similar recipes, by the ingredients they share.
+
+Every user recipe, and every Spoonacular recipe that has been saved to a board
+and is in the recipe cache, is a row of a sparse matrix with a column for each
+ingredient. Ingredients are weighted by how rare they are (tf-idf with binary
+counts) and rows are scaled to unit length, so the dot product of two rows is
+their cosine similarity.
+
+SimilarityIndex multiplies the matrix by its transpose a block of rows at a
+time and keeps the SIMILAR_TOP_K most similar recipes of each row, so the panel
+on a recipe page is a lookup in memory. Ingredients found in more than
+SIMILAR_MAX_DF of the recipes (salt, water, oil) say little about a dish and
+make the product nearly dense, so big indexes leave them out.
+
+Recipes are added as they are created or saved, and take their place in the
+top k of the recipes they are similar to. Ingredients the index hasn't seen
+before are added as rare ones; their weights and the pruning are brought up to
+date when the index is rebuilt, which a background thread does every
+SIMILAR_REBUILD seconds. Recipe pages that aren't in the index are compared
+with it once and the result is remembered.
+
+Added recipes are kept in a small buffer of rows, and scored against the rest
+through the transposed matrix, so an add only touches the recipes that share
+an ingredient with it. The buffer is merged into the matrix every ADD_BUFFER
+adds.
+
+Needs NumPy and SciPy, which are imported when the index is first built so
+they don't slow down starting a worker. Without them recipes have no similar
+recipes.
+'''
+
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+
+from models import db, UserRecipe, Recipe, RecipeCache, RecipeIngredient, normalize_ingredient
+from recipe_cache import LRUCache
+
+# NumPy and scipy.sparse, once load_numpy has imported them
+np = sparse = None
+
+# rows of the matrix multiplied at once while building; bounds the memory the product needs
+BLOCK_ROWS = 512
+# indexes with fewer recipes than this keep every ingredient, since each of them matters in a small collection
+PRUNE_MIN_RECIPES = 1000
+BATCH_SIZE = 1000
+# recipes added since the last merge that are kept apart from the matrix
+ADD_BUFFER = 256
+
+
+def load_numpy():
+    '''Import NumPy and SciPy if that hasn't been done yet. Returns False if they aren't installed.'''
+
+    global np, sparse
+    if sparse is None:
+        try:
+            import numpy
+            from scipy import sparse as scipy_sparse
+        except ImportError:
+            return False
+        np, sparse = numpy, scipy_sparse
+    return True
+
+
+def describe(recipe):
+    '''(id, ingredient names, card) of a UserRecipe or a Spoonacular recipe dict'''
+
+    if isinstance(recipe, UserRecipe):
+        names = [ingredient.name for ingredient in recipe.ingredients]
+        return recipe.id, names, {'id': recipe.id, 'title': recipe.title, 'image': recipe.image}
+    return (recipe['id'], ingredient_names(recipe.get('extendedIngredients')),
+            {'id': recipe['id'], 'title': recipe.get('title'), 'image': recipe.get('image')})
+
+
+def ingredient_names(extended_ingredients):
+    '''Names of the ingredients in a Spoonacular recipe's extendedIngredients'''
+
+    return [normalize_ingredient(ingredient.get('name') or ingredient.get('original') or '')
+            for ingredient in extended_ingredients or ()]
+
+
+def saved_recipes():
+    '''describe() of every user recipe and every cached Spoonacular recipe saved to a board, read in batches'''
+
+    names = defaultdict(list)
+    for recipe_id, name in db.session.query(RecipeIngredient.recipe_id, RecipeIngredient.name).yield_per(BATCH_SIZE):
+        names[recipe_id].append(name)
+    for recipe_id, title, image in db.session.query(UserRecipe.id, UserRecipe.title, UserRecipe.image).yield_per(BATCH_SIZE):
+        yield recipe_id, names.pop(recipe_id, ()), {'id': recipe_id, 'title': title, 'image': image}
+
+    saved = (db.session.query(RecipeCache.id, RecipeCache.data['extendedIngredients'],
+                              RecipeCache.data['title'], RecipeCache.data['image'])
+             .filter(RecipeCache.id.in_(db.session.query(Recipe.id)))
+             .yield_per(BATCH_SIZE))
+    for recipe_id, extended_ingredients, title, image in saved:
+        yield recipe_id, ingredient_names(extended_ingredients), {'id': recipe_id, 'title': title, 'image': image}
+
+
+class SimilarityIndex:
+    '''Ingredient vectors of a set of recipes and the top_k most similar recipes of each.
+
+    recipes is an iterable of describe() tuples. Recipes without ingredients are left out.'''
+
+    def __init__(self, recipes, top_k=8, max_df=0.05):
+        if not load_numpy():
+            raise ImportError("The similar recipes index needs NumPy and SciPy")
+        self.top_k = top_k
+        self.rows = {}
+        self.ids = []
+        self.cards = []
+        ingredient_sets = []
+        for recipe_id, names, card in recipes:
+            names = set(filter(None, names))
+            if names and recipe_id not in self.rows:
+                self.rows[recipe_id] = len(self.ids)
+                self.ids.append(recipe_id)
+                self.cards.append(card)
+                ingredient_sets.append(names)
+
+        count = len(ingredient_sets)
+        df = Counter(name for names in ingredient_sets for name in names)
+        limit = max_df * count if count >= PRUNE_MIN_RECIPES else count
+        kept = sorted(name for name, found in df.items() if found <= limit)
+        self.columns = {name: column for column, name in enumerate(kept)}
+        self.idf = np.array([math.log((1 + count) / (1 + df[name])) + 1 for name in kept], dtype=np.float32)
+
+        indices = []
+        indptr = [0]
+        for names in ingredient_sets:
+            indices.extend(sorted(self.columns[name] for name in names if name in self.columns))
+            indptr.append(len(indices))
+        self.matrix = self.vectors(np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64))
+
+        self.buffer = sparse.csr_matrix((0, len(self.columns)), dtype=np.float32)
+        # one row per ingredient, listing the recipes that have it
+        self.transposed = self.matrix.T.tocsr()
+
+        # room for the recipes added before the arrays next have to grow
+        self.neighbor_rows = np.full((count + ADD_BUFFER, top_k), -1, dtype=np.int64)
+        self.neighbor_scores = np.zeros((count + ADD_BUFFER, top_k), dtype=np.float32)
+        for start in range(0, count, BLOCK_ROWS):
+            block = (self.matrix[start:start + BLOCK_ROWS] @ self.transposed).tocsr()
+            # a recipe is not its own neighbor
+            block_rows = np.repeat(np.arange(start, start + block.shape[0]), np.diff(block.indptr))
+            block.data[block.indices == block_rows] = 0
+            for offset in range(block.shape[0]):
+                begin, end = block.indptr[offset], block.indptr[offset + 1]
+                self.set_neighbors(start + offset, block.indices[begin:end], block.data[begin:end])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def vectors(self, indices, indptr):
+        '''Unit length tf-idf rows with the given columns, as a CSR matrix'''
+
+        matrix = sparse.csr_matrix((self.idf[indices], indices, indptr),
+                                   shape=(len(indptr) - 1, len(self.columns)), dtype=np.float32)
+        lengths = np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1
+        lengths[lengths == 0] = 1
+        return sparse.csr_matrix(sparse.diags(1 / lengths) @ matrix, dtype=np.float32)
+
+    def add_columns(self, names):
+        '''Add columns for ingredients that no indexed recipe has, weighted as if one recipe had them'''
+
+        new = sorted(name for name in names if name not in self.columns)
+        if not new:
+            return
+        for name in new:
+            self.columns[name] = len(self.columns)
+        idf = math.log((1 + len(self.ids)) / 2) + 1
+        self.idf = np.concatenate([self.idf, np.full(len(new), idf, dtype=np.float32)])
+        self.matrix.resize((self.matrix.shape[0], len(self.columns)))
+        self.buffer.resize((self.buffer.shape[0], len(self.columns)))
+        self.transposed.resize((len(self.columns), self.matrix.shape[0]))
+
+    def vector(self, names):
+        '''The row for a recipe with these ingredients, using the index's columns'''
+
+        columns = sorted({self.columns[name] for name in names if name in self.columns})
+        return self.vectors(np.array(columns, dtype=np.int32), np.array([0, len(columns)], dtype=np.int64))
+
+    def top(self, rows, scores):
+        '''The top_k (rows, scores) with the highest scores, best first, leaving out zeros'''
+
+        if len(scores) > self.top_k:
+            best = np.argpartition(scores, len(scores) - self.top_k)[-self.top_k:]
+            rows, scores = rows[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        keep = order[scores[order] > 0]
+        return rows[keep], scores[keep]
+
+    def set_neighbors(self, row, rows, scores):
+        rows, scores = self.top(rows, scores)
+        self.neighbor_rows[row, :len(rows)] = rows
+        self.neighbor_scores[row, :len(rows)] = scores
+
+    def candidates(self, vector):
+        '''The rows with a cosine similarity to vector above zero, and their similarities'''
+
+        found = (vector @ self.transposed).tocsr()
+        rows, scores = found.indices.astype(np.int64), found.data
+        if self.buffer.shape[0]:
+            buffered = (self.buffer @ vector.T).toarray().ravel()
+            offsets = np.flatnonzero(buffered)
+            rows = np.concatenate([rows, offsets + self.matrix.shape[0]])
+            scores = np.concatenate([scores, buffered[offsets]])
+        return rows, scores
+
+    def similar(self, recipe_id):
+        '''Cards of the most similar recipes to an indexed recipe, or None if it isn't indexed'''
+
+        row = self.rows.get(recipe_id)
+        if row is None:
+            return None
+        return [self.cards[other] for other in self.neighbor_rows[row] if other >= 0]
+
+    def query(self, recipe_id, names):
+        '''Cards of the most similar recipes to one that isn't indexed'''
+
+        rows, _ = self.top(*self.candidates(self.vector(names)))
+        return [self.cards[row] for row in rows if self.ids[row] != recipe_id]
+
+    def add(self, recipe_id, names, card):
+        '''Add a recipe, and make it a neighbor of the recipes it is more similar to than their current ones'''
+
+        row = self.rows.get(recipe_id)
+        if row is not None:
+            self.cards[row] = card
+            return
+        names = set(filter(None, names))
+        if not names:
+            return
+
+        self.add_columns(names)
+        vector = self.vector(names)
+        rows, scores = self.candidates(vector)
+
+        row = len(self.ids)
+        self.rows[recipe_id] = row
+        self.ids.append(recipe_id)
+        self.cards.append(card)
+        if row == len(self.neighbor_rows):
+            self.grow()
+        self.set_neighbors(row, rows, scores)
+
+        closer = scores > self.neighbor_scores[rows, -1]
+        for other, score in zip(rows[closer], scores[closer]):
+            other_rows, other_scores = self.neighbor_rows[other], self.neighbor_scores[other]
+            position = int(np.searchsorted(-other_scores, -score, side='right'))
+            other_rows[position + 1:] = other_rows[position:-1].copy()
+            other_scores[position + 1:] = other_scores[position:-1].copy()
+            other_rows[position] = row
+            other_scores[position] = score
+
+        self.buffer = sparse.vstack([self.buffer, vector], format='csr')
+        if self.buffer.shape[0] >= ADD_BUFFER:
+            self.merge()
+
+    def grow(self):
+        '''Double the room in the neighbor arrays'''
+
+        size = len(self.neighbor_rows)
+        self.neighbor_rows = np.concatenate([self.neighbor_rows, np.full((size, self.top_k), -1, dtype=np.int64)])
+        self.neighbor_scores = np.concatenate([self.neighbor_scores, np.zeros((size, self.top_k), dtype=np.float32)])
+
+    def merge(self):
+        '''Move the buffered rows into the matrix'''
+
+        self.matrix = sparse.vstack([self.matrix, self.buffer], format='csr')
+        self.transposed = self.matrix.T.tocsr()
+        self.buffer = sparse.csr_matrix((0, len(self.columns)), dtype=np.float32)
+
+
+class SimilarRecipes:
+    '''Keeps a SimilarityIndex of the recipes in the database, rebuilt in the background'''
+
+    def __init__(self, app=None):
+        self.index = None
+        self.lock = threading.Lock()
+        # recipes added while a rebuild is reading the database, to add to the new index too
+        self.pending = None
+        self.queried = LRUCache(1000)
+        self.build_seconds = None
+        self.thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Read index settings from the app config and build the index before the first request'''
+
+        self.app = app
+        self.top_k = app.config.setdefault('SIMILAR_TOP_K', 8)
+        self.max_df = app.config.setdefault('SIMILAR_MAX_DF', 0.05)
+        self.interval = app.config.setdefault('SIMILAR_REBUILD', 60 * 60)
+        self.background = app.config.setdefault('SIMILAR_BACKGROUND', True)
+        app.before_first_request(self.start)
+
+    def start(self):
+        '''Build the index, on a background thread that keeps rebuilding it unless SIMILAR_BACKGROUND is off'''
+
+        if not load_numpy():
+            self.app.logger.warning("NumPy and SciPy are not installed, so recipe pages show no similar recipes")
+        elif not self.background:
+            self.rebuild()
+        elif self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='similar-recipes', daemon=True)
+            self.thread.start()
+
+    def rebuild(self):
+        '''Build a new index from the database and start using it'''
+
+        with self.lock:
+            self.pending = []
+        try:
+            started = time.perf_counter()
+            index = SimilarityIndex(saved_recipes(), self.top_k, self.max_df)
+            with self.lock:
+                for recipe in self.pending:
+                    index.add(*recipe)
+                self.index = index
+                self.queried.clear()
+                self.build_seconds = time.perf_counter() - started
+        finally:
+            with self.lock:
+                self.pending = None
+
+    def add(self, recipe):
+        '''Add a newly created or saved recipe (a UserRecipe or Spoonacular recipe dict)'''
+
+        if self.index is None and self.pending is None:
+            # the next build reads it from the database
+            return
+        described = describe(recipe)
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append(described)
+            if self.index is not None:
+                self.index.add(*described)
+            self.queried.clear()
+
+    def similar(self, recipe):
+        '''Cards of the recipes most similar to a UserRecipe or Spoonacular recipe dict'''
+
+        index = self.index
+        if index is None:
+            return []
+        recipe_id, names, card = describe(recipe)
+        with self.lock:
+            found = index.similar(recipe_id)
+        if found is None:
+            found = self.queried.get(recipe_id)
+        if found is None:
+            with self.lock:
+                found = index.query(recipe_id, names)
+            self.queried.set(recipe_id, found)
+        return found
+
+    def get_stats(self):
+        '''Recipes and ingredients in the index, and how long it took to build'''
+
+        index = self.index
+        return {'recipes': len(index) if index else 0, 'ingredients': len(index.columns) if index else 0,
+                'build_seconds': round(self.build_seconds or 0, 3)}
+
+    def run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.rebuild()
+            except Exception:
+                self.app.logger.exception("Building the similar recipes index failed")
+            time.sleep(self.interval)
@@ -0,0 +1,76 @@
+'''Sharing one call between everyone who asks for the same thing at once.
+
+When a recipe trends, many requests ask Spoonacular for the same recipe in the
+same moment. SingleFlight lets the first of them (the leader) make the call,
+and hands its result, or its exception, to the others that asked while it was
+in flight. Calls made after it finishes start a new flight.
+
+FileLease does the same across worker processes on one machine: whoever holds
+the lease on a key does the work, and the others wait for it and then find the
+result wherever the leader put it (for recipes, the database cache).
+'''
+
+import fcntl
+import hashlib
+import os
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+# keys are spread over this many lock files, so the directory doesn't grow with every key ever used
+LEASE_FILES = 1024
+
+
+class SingleFlight:
+    '''Coalesces concurrent calls with the same key within one process'''
+
+    def __init__(self):
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def do(self, key, fn):
+        '''Return fn(), unless a call with the same key is in flight, in which case wait for its result'''
+
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Future()
+
+        if not leader:
+            self.stats['shared'] += 1
+            return flight.result()
+
+        self.stats['calls'] += 1
+        try:
+            result = fn()
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.flights[key]
+
+
+class FileLease:
+    '''Exclusive lock on a key shared by every process using the same directory.
+    Use it as a context manager; it blocks until the lease is free. Two keys can share a
+    lock file, in which case one waits for the other.'''
+
+    def __init__(self, directory, key):
+        slot = int(hashlib.sha1(str(key).encode()).hexdigest(), 16) % LEASE_FILES
+        self.path = os.path.join(directory, f'lease-{slot}')
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
@@ -0,0 +1,184 @@
+'''Client for the Spoonacular recipe API.
+
+All calls share one requests.Session, so connections are kept alive and reused
+instead of paying for a new TCP and TLS handshake on every call. Failed calls
+(connection errors, 429 and 5xx responses) are retried with exponential backoff,
+honouring Retry-After when the API sends it.
+
+Settings are read from the app config by init_app:
+
+    SPOONACULAR_API_KEY             the API key sent with every call
+    SPOONACULAR_BASE_URL            defaults to https://api.spoonacular.com, point it at a stub to test
+    SPOONACULAR_POOL_SIZE           connections kept open per worker
+    SPOONACULAR_RETRIES             retries for a failed call
+    SPOONACULAR_BACKOFF             backoff factor in seconds between retries
+    SPOONACULAR_TIMEOUT             seconds to wait for a response
+    SPOONACULAR_COALESCE            share one call between concurrent identical calls (on by default)
+    SPOONACULAR_DAILY_POINTS        the plan's daily quota, in points
+    SPOONACULAR_MAX_CONCURRENT      calls in flight at once per worker
+    SPOONACULAR_SEARCH_RESERVE      share of the quota searches leave for recipe pages
+    SPOONACULAR_BACKGROUND_RESERVE  share of the quota background work leaves for everything else
+
+Calls are scheduled against the quota by quota.QuotaScheduler. Calls it turns
+away raise SpoonacularError like any other failed call.
+'''
+
+import time
+
+import requests
+from flask import g
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from quota import INTERACTIVE, OutboundRejected, QuotaScheduler, current_priority
+from singleflight import SingleFlight
+
+BASE_URL = 'https://api.spoonacular.com'
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class SpoonacularError(Exception):
+    '''A call to Spoonacular failed, even after retrying'''
+
+
+def estimated_points(path, params):
+    '''Quota points Spoonacular will charge for a call, going by its price list'''
+
+    if path == '/recipes/autocomplete':
+        return 0.1
+    if path == '/recipes/informationBulk':
+        return 1 + 0.5 * (len(str(params.get('ids', '')).split(',')) - 1)
+    if path in ('/recipes/random', '/recipes/complexSearch'):
+        return 1 + 0.01 * int(params.get('number', 10))
+    return 1
+
+
+class SpoonacularClient:
+    '''Pooled, retrying Spoonacular client with a method for each endpoint we use'''
+
+    def __init__(self, api_key=None, base_url=BASE_URL, pool_size=10, retries=3, backoff=0.5, timeout=10, app=None):
+        self.hooks = []
+        self.flights = SingleFlight()
+        self.coalesce = True
+        self.scheduler = QuotaScheduler()
+        self.configure(api_key, base_url, pool_size, retries, backoff, timeout)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Read client settings from the app config'''
+
+        self.configure(
+            api_key=app.config.get('SPOONACULAR_API_KEY'),
+            base_url=app.config.setdefault('SPOONACULAR_BASE_URL', BASE_URL),
+            pool_size=app.config.setdefault('SPOONACULAR_POOL_SIZE', 10),
+            retries=app.config.setdefault('SPOONACULAR_RETRIES', 3),
+            backoff=app.config.setdefault('SPOONACULAR_BACKOFF', 0.5),
+            timeout=app.config.setdefault('SPOONACULAR_TIMEOUT', 10),
+        )
+        self.coalesce = app.config.setdefault('SPOONACULAR_COALESCE', True)
+        self.scheduler.configure(
+            daily_points=app.config.setdefault('SPOONACULAR_DAILY_POINTS', 150),
+            max_concurrent=app.config.setdefault('SPOONACULAR_MAX_CONCURRENT', app.config['SPOONACULAR_POOL_SIZE']),
+            search_reserve=app.config.setdefault('SPOONACULAR_SEARCH_RESERVE', 0.1),
+            background_reserve=app.config.setdefault('SPOONACULAR_BACKGROUND_RESERVE', 0.3),
+        )
+        app.before_request(self.start_request)
+        app.teardown_request(self.finish_request)
+
+    def start_request(self):
+        '''Calls made while handling a request are interactive unless they say otherwise'''
+
+        g.spoonacular_priority = current_priority.set(INTERACTIVE)
+
+    def finish_request(self, exc=None):
+        token = g.pop('spoonacular_priority', None)
+        if token is not None:
+            current_priority.reset(token)
+
+    def configure(self, api_key, base_url, pool_size, retries, backoff, timeout):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def add_hook(self, hook):
+        '''Call hook(seconds) after every call sent, with how long it took including retries'''
+
+        self.hooks.append(hook)
+
+    def get(self, path, params=None, not_found=SpoonacularError):
+        '''GET an endpoint and return its JSON. A 404 returns not_found instead,
+        unless not_found is SpoonacularError. Raises SpoonacularError on failure.
+
+        Identical calls of the same priority made while one is in flight wait for
+        its response instead of calling again, so a call never waits on, or fails
+        with, the quota slot of a lower priority call. Each caller parses the
+        response itself, so callers never share the returned objects.'''
+
+        params = dict(params or {})
+        try:
+            if self.coalesce:
+                key = (current_priority.get(), path, tuple(sorted(params.items())))
+                res = self.flights.do(key, lambda: self.send(path, params))
+            else:
+                res = self.send(path, params)
+            if res.status_code == 404 and not_found is not SpoonacularError:
+                return not_found
+            res.raise_for_status()
+            return res.json()
+        except (requests.RequestException, ValueError, OutboundRejected) as e:
+            raise SpoonacularError(f'GET {path} failed: {e}') from e
+
+    def send(self, path, params):
+        '''Make one call and return its requests.Response'''
+
+        with self.scheduler.slot(estimated_points(path, params)):
+            start = time.perf_counter()
+            try:
+                res = self.session.get(f'{self.base_url}{path}', params=dict(params, apiKey=self.api_key),
+                                       timeout=self.timeout)
+            finally:
+                for hook in self.hooks:
+                    hook(time.perf_counter() - start)
+            self.scheduler.update(res.headers, res.status_code)
+            return res
+
+    def random(self, number):
+        '''List of number random recipes, with full information'''
+
+        return self.get('/recipes/random', {'number': number})['recipes']
+
+    def search(self, query, number, offset=0, exclude=()):
+        '''One page of search results, as a dict with results and totalResults'''
+
+        params = {'query': query, 'number': number, 'offset': offset}
+        if exclude:
+            params['excludeIngredients'] = ','.join(exclude)
+        return self.get('/recipes/complexSearch', params)
+
+    def information(self, recipe_id):
+        '''Full information on one recipe, or None if there is no such recipe'''
+
+        return self.get(f'/recipes/{recipe_id}/information', not_found=None)
+
+    def information_bulk(self, recipe_ids):
+        '''Full information on many recipes in one call. Unknown ids are left out.'''
+
+        return self.get('/recipes/informationBulk', {'ids': ','.join(str(recipe_id) for recipe_id in recipe_ids)})
+
+    def autocomplete(self, query, number=10):
+        '''Recipe titles starting with query, as a list of {id, title}'''
+
+        return self.get('/recipes/autocomplete', {'query': query, 'number': number})
@@ -0,0 +1,128 @@
+# run these tests with:
+#
+#    python -m unittest test_api.py
+#
+# They need the test database:
+#
+#   createdb capstone_one-test
+
+import gzip
+import json
+import os
+from unittest import TestCase, skipIf
+
+from models import db, User, UserRecipe, Board, Recipe, RecipeIngredient
+
+os.environ['DATABASE_URL'] = 'postgresql:///capstone_one-test'
+
+from app import create_app, recipe_cache, CURR_USER_KEY
+import compression
+import projections
+
+app = create_app({'TESTING': True})
+
+
+class ApiTestCase(TestCase):
+    '''Tests for the versioned JSON API and response compression'''
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+
+        self.user = User.register('cook', 'password', 'cook@testing.com', "Test", "Cook")
+        db.session.commit()
+
+        recipe = UserRecipe(title="Milkshake", user_id=self.user.id, instructions="Blend",
+                            ingredients=RecipeIngredient.from_list(["2 Cups Ice Cream", "1 Cup Milk"]))
+        board = Board(name="drinks", user_id=self.user.id)
+        db.session.add_all([recipe, board])
+        db.session.commit()
+
+        summaries = {recipe_id: {'title': f'Recipe {recipe_id}', 'image': 'https://spoonacular.com/a.jpg',
+                                 'source': 'spoonacular'} for recipe_id in range(1, 3001)}
+        Recipe.add_many_to_board(board.id, list(summaries), summaries)
+        db.session.commit()
+
+        self.recipe_id = recipe.id
+        self.board_id = board.id
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user.id
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_recipe(self):
+        res = self.client.get(f'/api/v1/recipes/{self.recipe_id}')
+        self.assertEqual(res.json['ingredients'], ["2 Cups Ice Cream", "1 Cup Milk"])
+        self.assertEqual(res.json['source'], 'user')
+
+        recipe_cache.store({716429: {'id': 716429, 'title': 'Pasta', 'image': 'pasta.jpg', 'servings': 2,
+                                     'extendedIngredients': [{'original': '1 lb pasta', 'name': 'pasta'}],
+                                     'nutrition': {'nutrients': [{'name': 'Calories'}] * 50}}})
+        db.session.commit()
+        res = self.client.get('/api/v1/recipes/716429')
+        self.assertEqual(res.json['ingredients'], ['1 lb pasta'])
+        self.assertEqual(res.json['servings'], 2)
+        self.assertNotIn('nutrition', res.json)
+
+        res = self.client.get('/api/v1/recipes/99999999')
+        self.assertEqual(res.status_code, 404)
+
+    def test_boards(self):
+        res = self.client.get(f'/api/v1/users/{self.user.id}/boards')
+        self.assertEqual(res.json, {'boards': [{'id': self.board_id, 'name': 'drinks', 'user_id': self.user.id,
+                                                'recipe_count': 3000}]})
+
+        res = self.client.get(f'/api/v1/boards/{self.board_id}/recipes')
+        self.assertTrue(res.is_streamed)
+        data = json.loads(res.data)
+        self.assertEqual(data['board']['name'], 'drinks')
+        self.assertEqual(len(data['recipes']), 3000)
+        self.assertEqual(set(data['recipes'][0]), {'id', 'title', 'image', 'thumbnail'})
+
+        self.client.cookie_jar.clear()
+        res = self.client.get(f'/api/v1/boards/{self.board_id}/recipes')
+        self.assertEqual(res.status_code, 401)
+
+    def test_gzip(self):
+        res = self.client.get(f'/api/v1/boards/{self.board_id}/recipes', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res.vary)
+        self.assertEqual(len(json.loads(gzip.decompress(res.data))['recipes']), 3000)
+
+        # too small to be worth it
+        res = self.client.get(f'/api/v1/users/{self.user.id}/boards', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', res.headers)
+
+        res = self.client.get(f'/api/v1/boards/{self.board_id}/recipes', headers={'Accept-Encoding': 'deflate'})
+        self.assertNotIn('Content-Encoding', res.headers)
+
+        res = self.client.get('/static/stylesheets/base.css', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        with open('static/stylesheets/base.css', 'rb') as css:
+            self.assertEqual(gzip.decompress(res.data), css.read())
+
+    def test_pages_are_not_compressed(self):
+        # pages carry the CSRF token, so compressing them would expose it to BREACH
+        res = self.client.get(f'/recipe/created/{self.recipe_id}', headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(res.mimetype, 'text/html')
+        self.assertGreater(len(res.data), app.config['COMPRESS_MIN_SIZE'])
+        self.assertNotIn('Content-Encoding', res.headers)
+
+    @skipIf(compression.brotli is None, 'Brotli is not installed')
+    def test_brotli(self):
+        res = self.client.get(f'/api/v1/boards/{self.board_id}/recipes',
+                              headers={'Accept-Encoding': 'gzip, deflate, br'})
+        self.assertEqual(res.headers['Content-Encoding'], 'br')
+        self.assertEqual(len(json.loads(compression.brotli.decompress(res.data))['recipes']), 3000)
+
+
+class StreamJsonTestCase(TestCase):
+    '''Tests for encoding a long list a chunk at a time'''
+
+    def test_stream_json(self):
+        for head, items in [({}, []), ({'board': {'id': 1}}, [{'id': i} for i in range(5000)])]:
+            chunks = list(projections.stream_json(head, 'recipes', iter(items)))
+            self.assertEqual(json.loads(''.join(chunks)), dict(head, recipes=items))
+        self.assertGreater(len(chunks), 2)
@@ -0,0 +1,52 @@
+#    run these tests with:
+#
+#    python -m unittest test_autocomplete.py
+#
+# These need neither a database nor a Spoonacular API key.
+
+from unittest import TestCase
+
+from flask import Flask
+
+from autocomplete import TitleIndex
+
+
+class TitleIndexTestCase(TestCase):
+    """Test the autocomplete title index"""
+
+    def setUp(self):
+        self.remote = {}
+        app = Flask(__name__)
+        app.config.update(AUTOCOMPLETE_MAX_LEARNED=10)
+        self.index = TitleIndex(fetch_remote=lambda prefix: self.remote.get(prefix, []), app=app)
+
+    def test_lookup(self):
+        self.index.add(10000001, 'Garlic Butter Chicken')
+        self.index.add(10000002, 'Chocolate Cake')
+
+        self.assertEqual(self.index.lookup('chi'), [{'id': 10000001, 'title': 'Garlic Butter Chicken'}])
+        self.assertEqual(self.index.lookup('butter ch'), [{'id': 10000001, 'title': 'Garlic Butter Chicken'}])
+        self.assertEqual(self.index.lookup('cake gar'), [])
+
+    def test_lookup_several_words(self):
+        self.index.add(10000001, 'Garlic Butter Chicken')
+        self.index.add(10000002, 'Chicken Rice')
+        self.index.add(10000003, 'Chicken Chili')
+
+        self.assertEqual(self.index.lookup('zzz chi'), [])
+        self.assertEqual(self.index.lookup('chicken ri'), [{'id': 10000002, 'title': 'Chicken Rice'}])
+        self.assertEqual([result['id'] for result in self.index.lookup('chi chi')], [10000003, 10000002, 10000001])
+        self.assertEqual(self.index.lookup('chi chili'), [{'id': 10000003, 'title': 'Chicken Chili'}])
+
+    def test_learned_titles_are_capped(self):
+        self.index.add(10000001, 'Pasta Bake')
+        for batch in range(3):
+            self.remote['pa'] = [{'id': batch * 10 + n, 'title': f'Pasta {batch} {n}'} for n in range(10)]
+            self.index.learn('pa')
+
+        self.assertLessEqual(len(self.index.learned), 10)
+        found = {result['id'] for result in self.index.lookup('pasta', limit=100)}
+        # user recipes are never forgotten, and the newest learned titles are kept
+        self.assertIn(10000001, found)
+        self.assertTrue({20, 29} <= found)
+        self.assertNotIn(0, found)
@@ -0,0 +1,108 @@
+# run these tests with:
+#
+#    python -m unittest test_backup.py
+#
+# They need the test database:
+#
+#   createdb capstone_one-test
+
+import json
+import os
+from unittest import TestCase, mock
+
+from models import db, User, UserRecipe, Board, Recipe, RecipeIngredient
+
+os.environ['DATABASE_URL'] = 'postgresql:///capstone_one-test'
+
+from app import create_app, CURR_USER_KEY
+import backup
+
+app = create_app({'TESTING': True})
+
+
+class BackupTestCase(TestCase):
+    '''Tests for exporting and importing a user's boards and recipes'''
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+
+        self.user = User.register('source', 'password', 'source@testing.com', "Source", "User")
+        self.other = User.register('target', 'password', 'target@testing.com', "Target", "User")
+        db.session.commit()
+
+        recipe = UserRecipe(title="Milkshake", user_id=self.user.id, instructions="Blend",
+                            ingredients=RecipeIngredient.from_list(["2 Cups Ice Cream", "1 Cup Milk"]))
+        empty = UserRecipe(title="Water", user_id=self.user.id)
+        board = Board(name="drinks", user_id=self.user.id)
+        db.session.add_all([recipe, empty, board])
+        db.session.commit()
+
+        Recipe.add_to_board(board.id, 716429, {'title': 'Pasta', 'image': 'pasta.jpg', 'source': 'spoonacular'})
+        Recipe.add_many_to_board(board.id, [recipe.id, 1, 2])
+        db.session.commit()
+
+        self.recipe_id = recipe.id
+        self.board_id = board.id
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_export(self):
+        lines = [json.loads(text) for text in backup.export_user(self.user)]
+
+        self.assertEqual(lines[0], {'type': 'export', 'version': 1, 'username': 'source'})
+        self.assertEqual([line['type'] for line in lines[1:]], ['recipe', 'recipe', 'board'] + ['saved'] * 4)
+        self.assertEqual(lines[1]['ingredients'], ["2 Cups Ice Cream", "1 Cup Milk"])
+        self.assertEqual(lines[2]['ingredients'], [])
+        self.assertEqual(lines[4], {'type': 'saved', 'board': self.board_id, 'id': 716429, 'title': 'Pasta',
+                                    'image': 'pasta.jpg', 'source': 'spoonacular'})
+
+    def test_import(self):
+        counts = backup.import_user(self.other, list(backup.export_user(self.user)))
+
+        self.assertEqual(counts, {'recipes': 2, 'boards': 1, 'saved': 4})
+        board = Board.query.filter_by(user_id=self.other.id).one()
+        recipe = UserRecipe.query.filter_by(user_id=self.other.id, title="Milkshake").one()
+        self.assertNotEqual(recipe.id, self.recipe_id)
+        self.assertEqual([i.name for i in recipe.ingredients], ["ice cream", "milk"])
+
+        # the saved copy of an imported recipe points at the new recipe
+        saved = {row.id: row.title for row in Recipe.query.filter_by(board_id=board.id)}
+        self.assertEqual(saved, {716429: 'Pasta', recipe.id: None, 1: None, 2: None})
+
+    def test_import_bad_line(self):
+        with self.assertRaises(backup.BackupError):
+            backup.import_user(self.other, ['{"type": "saved", "board": 5, "id": 1}'])
+        with self.assertRaises(backup.BackupError):
+            backup.import_user(self.other, ['not json'])
+
+    def test_import_rolled_back(self):
+        added = []
+        lines = [backup.line({'type': 'recipe', 'id': n, 'title': f'Soup {n}'}) for n in range(3)]
+        lines.append(backup.line({'type': 'saved', 'board': 5, 'id': 1}))
+
+        # recipes are flushed in batches before the bad line is read
+        with mock.patch.object(backup, 'BATCH_SIZE', 2), self.assertRaises(backup.BackupError):
+            backup.import_user(self.other, lines, on_recipe=lambda *recipe: added.append(recipe))
+
+        self.assertEqual(added, [])
+        self.assertEqual(UserRecipe.query.filter_by(user_id=self.other.id).count(), 0)
+
+        backup.import_user(self.other, lines[:3], on_recipe=lambda *recipe: added.append(recipe))
+        self.assertEqual([title for recipe_id, title in added], ['Soup 0', 'Soup 1', 'Soup 2'])
+
+    def test_routes(self):
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.other.id
+
+            export = client.get('/users/export')
+            self.assertEqual(export.mimetype, 'application/x-ndjson')
+
+            res = client.post('/users/import', data=export.data, content_type='text/plain')
+            self.assertEqual(res.status_code, 415)
+
+            res = client.post('/users/import', data=backup.line({'type': 'board', 'id': 1, 'name': 'new'}),
+                              content_type='application/x-ndjson')
+            self.assertEqual(res.json, {'recipes': 0, 'boards': 1, 'saved': 0})
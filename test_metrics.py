@@ -0,0 +1,58 @@
+#    run these tests with:
+#
+#    python -m unittest test_metrics.py
+#
+# These use a bare Flask app, so they need neither a database nor an API key.
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from flask import Flask, render_template_string
+
+import metrics
+
+
+class MetricsTestCase(TestCase):
+    '''Tests for the per request timings and the /metrics route'''
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.metrics = metrics.Metrics(self.app)
+        self.executor = ThreadPoolExecutor(max_workers=2)
+
+        @self.app.route('/page')
+        def page():
+            # an API call made on another thread counts for this request
+            metrics.submit(self.executor, self.metrics.record_api_call, 0.25).result()
+            return render_template_string('{{ inner }}', inner=render_template_string('hi'))
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_histogram(self):
+        histogram = metrics.Histogram('test_seconds', 'Test', (0.1, 1))
+        histogram.observe('/a', 0.05)
+        histogram.observe('/a', 0.5)
+        histogram.observe('/a', 5)
+
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{route="/a",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{route="/a",le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{route="/a",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_sum{route="/a"} 5.55', lines)
+        self.assertIn('test_seconds_count{route="/a"} 3', lines)
+
+    def test_request_breakdown(self):
+        client = self.app.test_client()
+        self.assertEqual(client.get('/page').data, b'hi')
+
+        self.metrics.add_collector(lambda: metrics.gauges('things', 'Things', {'b': 2, 'a': 1}, 'kind'))
+        res = client.get('/metrics')
+        text = res.data.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.content_type.startswith('text/plain'))
+        self.assertIn('request_api_calls_sum{route="/page"} 1', text)
+        self.assertIn('request_api_seconds_sum{route="/page"} 0.25', text)
+        self.assertIn('request_render_seconds_count{route="/page"} 1', text)
+        self.assertIn('things{kind="a"} 1\nthings{kind="b"} 2', text)
@@ -3,9 +3,12 @@
 #    python -m unittest test_user_model.py
 
 import os
-from unittest import TestCase
-from sqlalchemy import exc
-from models import db, connect_db, User, UserRecipe, Board, Recipe
+from datetime import datetime, timedelta
+from unittest import TestCase, mock
+from sqlalchemy import exc, event
+from models import db, connect_db, User, UserRecipe, Board, Recipe, RecipeCache, PoolRecipe, RecipeIngredient
+from passwords import hasher, hash_rounds
+from recipe_pool import RandomRecipePool
 
 # create database in venv:
 #
@@ -15,8 +18,9 @@ from models import db, connect_db, User, UserRecipe, Board, Recipe
 
 os.environ['DATABASE_URL'] = 'postgresql:///capstone_one-test'
 
-from app import app
+from app import create_app, recipe_cache, recipe_summaries, CURR_USER_KEY, CURR_USER_INFO_KEY
 
+app = create_app({'TESTING': True})
 db.create_all()
 
 
@@ -112,7 +116,48 @@ class UserModelTestCase(TestCase):
     def test_invalid_password(self):
         self.assertFalse(User.authenticate(self.user1.username, 'wrongpassword'))
 
+    def test_rehash_on_login(self):
+        rounds = hasher.rounds
+        hasher.rounds = rounds - 1
+        try:
+            user = User.authenticate(self.user1.username, 'password')
+            self.assertEqual(hash_rounds(user.password), rounds - 1)
+            self.assertEqual(User.authenticate(self.user1.username, 'password').id, self.user1.id)
+        finally:
+            hasher.rounds = rounds
+
 # Test board model for user2
+    def test_deleted_user_is_logged_out(self):
+        '''Is a user deleted from another browser logged out everywhere else?'''
+
+        csrf = mock.patch.dict(app.config, WTF_CSRF_ENABLED=False)
+        csrf.start()
+        self.addCleanup(csrf.stop)
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 131315
+        self.assertEqual(client.get('/users/export').status_code, 200)
+
+        db.session.delete(User.query.get(131315))
+        db.session.commit()
+
+        res = client.get('/users/export')
+        self.assertEqual((res.status_code, res.location), (302, 'http://localhost/login'))
+        with client.session_transaction() as sess:
+            self.assertNotIn(CURR_USER_KEY, sess)
+            self.assertNotIn(CURR_USER_INFO_KEY, sess)
+
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 131315
+            sess[CURR_USER_INFO_KEY] = {'username': 'test2', 'first_name': 'Brock', 'last_name': 'Lewis'}
+        res = client.post('/users/boards/new', data={'name': 'ghost'})
+        self.assertEqual((res.status_code, res.location), (302, 'http://localhost/login'))
+        self.assertIsNone(Board.query.filter_by(name='ghost').first())
+
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 131315
+        self.assertEqual(client.post('/users/delete').status_code, 302)
+
     def test_board_model(self):
         """Does basic model work?"""
 
@@ -142,6 +187,106 @@ class UserModelTestCase(TestCase):
 
         self.assertEqual(len(self.testboard.recipe_ids), 1)
 
+    def test_add_to_board(self):
+        '''Is a recipe only saved to a board once?'''
+
+        self.assertTrue(Recipe.add_to_board(999999, 716429))
+        self.assertFalse(Recipe.add_to_board(999999, 716429))
+        self.assertEqual(Recipe.add_many_to_board(999999, [716429, 1, 2, 2]), 2)
+        db.session.commit()
+
+        self.assertEqual(sorted(recipe.id for recipe in self.testboard.recipe_ids), [1, 2, 716429])
+
+        dupe = Recipe(board_id=999999, id=1)
+        db.session.add(dupe)
+        with self.assertRaises(exc.IntegrityError):
+            db.session.commit()
+
+    def test_recipe_summaries(self):
+        '''Are summaries stored when saving and updated on every board?'''
+
+        other = Board(name="other", user_id=131313)
+        db.session.add(other)
+        db.session.commit()
+
+        Recipe.add_to_board(999999, 716429, {'title': 'Pasta', 'image': 'pasta.jpg', 'source': 'spoonacular'})
+        Recipe.add_to_board(other.id, 716429)
+        db.session.commit()
+
+        saved = Recipe.query.filter_by(board_id=999999).one()
+        self.assertEqual(saved.title, 'Pasta')
+        self.assertIsNotNone(saved.refreshed_at)
+        self.assertIsNone(Recipe.query.filter_by(board_id=other.id).one().refreshed_at)
+
+        Recipe.update_summaries({716429: {'title': 'Better Pasta', 'image': 'pasta2.jpg', 'source': 'spoonacular'}})
+        db.session.commit()
+
+        self.assertEqual({recipe.title for recipe in Recipe.query.filter_by(id=716429)}, {'Better Pasta'})
+
+    def test_failed_summaries(self):
+        '''Are recipes that fail to load left without a summary and retried after a while?'''
+
+        Recipe.add_many_to_board(999999, [1, 2])
+        db.session.commit()
+        load = mock.Mock(return_value={})
+
+        with mock.patch.object(recipe_summaries, 'load_recipes', load):
+            self.assertEqual(recipe_summaries.refresh_stale(), 0)
+            recipe_summaries.fill_missing(Recipe.query.filter_by(board_id=999999).all())
+        self.assertEqual(load.call_count, 1)
+
+        rows = Recipe.query.filter_by(board_id=999999).all()
+        self.assertEqual({(row.refreshed_at, row.title) for row in rows}, {(None, None)})
+
+        Recipe.query.update({'refresh_failed_at': datetime.utcnow() - timedelta(days=1)})
+        db.session.commit()
+        load.return_value = {1: {'id': 1, 'title': 'Soup', 'image': 'soup.jpg'}}
+        with mock.patch.object(recipe_summaries, 'load_recipes', load):
+            recipe_summaries.fill_missing(Recipe.query.filter_by(board_id=999999).all())
+
+        self.assertEqual(load.call_args[0][0], [1, 2])
+        soup = Recipe.query.filter_by(board_id=999999, id=1).one()
+        self.assertEqual(soup.title, 'Soup')
+        self.assertIsNone(soup.refresh_failed_at)
+
+    def test_board_with_failed_summary_queries(self):
+        '''Does a recipe that can't be loaded leave the board rendering from one query?'''
+
+        summaries = {recipe_id: {'title': f'Recipe {recipe_id}', 'image': 'a.jpg', 'source': 'spoonacular'}
+                     for recipe_id in range(1, 51)}
+        Recipe.add_many_to_board(999999, list(summaries) + [99999999], summaries)
+        db.session.commit()
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 131313
+        # the first request warms up the app's caches
+        self.client.get('/login')
+
+        statements = []
+        def count(*args):
+            statements.append(args)
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            with mock.patch.object(recipe_summaries, 'load_recipes', mock.Mock(return_value={})):
+                res = self.client.get('/boards/999999')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Recipe 50', res.get_data(as_text=True))
+        # not one per recipe
+        self.assertLess(len(statements), 10)
+
+    def test_board_recipe_counts(self):
+        '''Are boards counted without loading their recipes?'''
+
+        empty = Board(name="empty", user_id=131313)
+        db.session.add_all([empty, Recipe(board_id=999999, id=1), Recipe(board_id=999999, id=2)])
+        db.session.commit()
+
+        counts = {board.name: count for board, count in Board.with_recipe_counts(131313)}
+        self.assertEqual(counts, {"tester": 2, "empty": 0})
+
 # Test user recipe model for user2
     def test_user_recipe_model(self):
         '''Does basic model work'''
@@ -149,8 +294,7 @@ class UserModelTestCase(TestCase):
         ur = UserRecipe(
             title="Milkshake",
             user_id=131315,
-            ingredient_1="2 Cups Ice Cream",
-            ingredient_2="1 Cup Milk",
+            ingredients=RecipeIngredient.from_list(["2 Cups Ice Cream", "1 Cup Milk"]),
             instructions="Blend together and enjoy!"
         )
 
@@ -158,4 +302,157 @@ class UserModelTestCase(TestCase):
         db.session.commit()
 
 
-        self.assertEqual(len(self.user2.created_recipes), 1)
\ No newline at end of file
+        self.assertEqual(len(self.user2.created_recipes), 1)
+        self.assertEqual(ur.ingredient_list(), ["2 Cups Ice Cream", "1 Cup Milk"])
+        self.assertEqual([i.name for i in ur.ingredients], ["ice cream", "milk"])
+
+# Test recipe cache model
+    def test_recipe_cache_model(self):
+        '''Does basic model work?'''
+
+        rc = RecipeCache(id=716429, data={'id': 716429, 'title': 'Pasta'})
+
+        db.session.add(rc)
+        db.session.commit()
+
+        cached = RecipeCache.query.get(716429)
+        self.assertEqual(cached.data['title'], 'Pasta')
+        self.assertIsNotNone(cached.fetched_at)
+        self.assertIsNotNone(cached.last_used_at)
+
+    def test_recipe_cache_store(self):
+        '''Are fetched recipes stored and old ones evicted without committing the session?'''
+
+        db.session.add(Board(name="unsaved", user_id=131313))
+        for start in range(0, 150, 50):
+            recipe_cache.store({recipe_id: {'id': recipe_id} for recipe_id in range(start, start + 50)})
+        with mock.patch.object(recipe_cache, 'max_rows', 100):
+            recipe_cache.evict()
+        db.session.rollback()
+
+        self.assertIsNone(Board.query.filter_by(name="unsaved").first())
+        self.assertEqual(RecipeCache.query.count(), 100)
+        self.assertEqual(RecipeCache.query.order_by(RecipeCache.id).first().id, 50)
+
+    def test_recipe_cache_touch(self):
+        '''Do reads mark recipes as used without committing the session?'''
+
+        recipe_cache.store({716429: {'id': 716429, 'title': 'Pasta'}})
+        long_ago = datetime.utcnow() - timedelta(days=1)
+        RecipeCache.query.update({'last_used_at': long_ago})
+        db.session.commit()
+        recipe_cache.memory.clear()
+
+        db.session.add(Board(name="unsaved", user_id=131313))
+        self.assertEqual(recipe_cache.get(716429)['title'], 'Pasta')
+        db.session.rollback()
+
+        self.assertIsNone(Board.query.filter_by(name="unsaved").first())
+        self.assertGreater(RecipeCache.query.get(716429).last_used_at, long_ago)
+
+        # memory hits are recorded too, once the interval has passed
+        RecipeCache.query.update({'last_used_at': long_ago})
+        db.session.commit()
+        recipe_cache.get(716429)
+        self.assertEqual(RecipeCache.query.get(716429).last_used_at, long_ago)
+
+        data, fetched_at, touched_at = recipe_cache.memory.get(716429)
+        recipe_cache.memory.set(716429, (data, fetched_at, long_ago))
+        recipe_cache.get(716429)
+        db.session.rollback()
+        self.assertGreater(RecipeCache.query.get(716429).last_used_at, long_ago)
+
+# Test random recipe pool model
+    def test_pool_recipe_model(self):
+        '''Does basic model work?'''
+
+        pr = PoolRecipe(id=654959, title="Pasta With Tuna", image="https://spoonacular.com/recipeImages/654959-556x370.jpg")
+
+        db.session.add(pr)
+        db.session.commit()
+
+        self.assertEqual(PoolRecipe.query.count(), 1)
+        self.assertIsNotNone(PoolRecipe.query.get(654959).added_at)
+
+    def test_random_pool_retries(self):
+        '''Does the pool retry soon when the first fetch fails?'''
+
+        fetch = mock.Mock(side_effect=[[], [{'id': 654959, 'title': 'Pasta With Tuna'}]])
+        pool = RandomRecipePool(fetch_random=fetch)
+        pool.app = app
+        pool.size, pool.batch, pool.interval, pool.retry = 10, 10, 900, 30
+
+        with app.app_context():
+            pool.refresh()
+        self.assertEqual(pool.sample(5), [])
+
+        with mock.patch('recipe_pool.time.sleep', side_effect=[None, None, StopIteration]) as sleep:
+            with self.assertRaises(StopIteration):
+                pool.run()
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [30, 900, 900])
+        self.assertEqual(fetch.call_count, 2)
+        self.assertEqual([recipe['id'] for recipe in pool.sample(5)], [654959])
+
+# Test searching user recipes
+    def test_user_recipe_search(self):
+        '''Does search match title, ingredients and prefixes?'''
+
+        ur = UserRecipe(
+            title="Chicken Alfredo",
+            user_id=131315,
+            ingredients=RecipeIngredient.from_list(["1 lb Fettuccine", "2 Cups Cream"]),
+            instructions="Boil pasta and toss with the sauce."
+        )
+
+        db.session.add(ur)
+        db.session.commit()
+
+        self.assertEqual(UserRecipe.search("chick"), [ur])
+        self.assertEqual(UserRecipe.search("fettuccine cream"), [ur])
+        self.assertEqual(UserRecipe.search("peanuts"), [])
+
+    def test_search_after_ingredient_changes(self):
+        '''Does search follow ingredients that are added, edited and deleted on their own?'''
+
+        ur = UserRecipe(title="Alfredo", user_id=131315,
+                        ingredients=RecipeIngredient.from_list(["1 lb Fettuccine", "2 Cups Cream"]))
+        db.session.add(ur)
+        db.session.commit()
+
+        db.session.add(RecipeIngredient(recipe_id=ur.id, position=2, original="1 tsp Saffron", name="saffron"))
+        db.session.commit()
+        self.assertEqual(UserRecipe.search("saffron"), [ur])
+
+        ur.ingredients[0].original = "1 lb Linguine"
+        db.session.commit()
+        self.assertEqual(UserRecipe.search("linguine"), [ur])
+        self.assertEqual(UserRecipe.search("fettuccine"), [])
+
+        db.session.delete(ur.ingredients[1])
+        db.session.commit()
+        self.assertEqual(UserRecipe.search("cream"), [])
+        self.assertEqual(UserRecipe.search("saffron linguine"), [ur])
+
+# Test finding user recipes by ingredient
+    def test_user_recipe_with_ingredients(self):
+        '''Can recipes be found by what they do and don't contain?'''
+
+        satay = UserRecipe(
+            title="Chicken Satay",
+            user_id=131315,
+            ingredients=RecipeIngredient.from_list(["1 lb Chicken Thighs", "1/2 cup Peanut Butter"]),
+            instructions="Grill the chicken and serve with the sauce."
+        )
+        soup = UserRecipe(
+            title="Chicken Soup",
+            user_id=131315,
+            ingredients=RecipeIngredient.from_list(["1 Whole Chicken", "2 Carrots"]),
+            instructions="Simmer for two hours."
+        )
+
+        db.session.add_all([satay, soup])
+        db.session.commit()
+
+        self.assertEqual(UserRecipe.with_ingredients(include=["chicken"], exclude=["peanuts"]), [soup])
+        self.assertEqual(UserRecipe.with_ingredients(include=["carrot"]), [soup])
+        self.assertEqual(UserRecipe.search("chicken", exclude_ingredients=["peanut"]), [soup])
@@ -0,0 +1,76 @@
+#    run these tests with:
+#
+#    python -m unittest test_prefetch.py
+#
+# These need neither a database nor a Spoonacular API key.
+
+from unittest import TestCase
+
+from flask import Flask
+
+from prefetch import Prefetcher
+
+
+class FakeRecipeCache:
+    def __init__(self):
+        self.recipes = {}
+
+    def uncached(self, recipe_ids):
+        return [recipe_id for recipe_id in recipe_ids if recipe_id not in self.recipes]
+
+    def store(self, recipes):
+        self.recipes.update(recipes)
+
+
+class PrefetcherTestCase(TestCase):
+    """Test prefetching of the top results of a page"""
+
+    def setUp(self):
+        self.cache = FakeRecipeCache()
+        self.fetched = []
+
+        def fetch_many(recipe_ids):
+            self.fetched.append(recipe_ids)
+            return {recipe_id: {'id': recipe_id} for recipe_id in recipe_ids}
+
+        app = Flask(__name__)
+        app.config.update(PREFETCH_ENABLED=True, PREFETCH_TOP_N=3, PREFETCH_BUDGET=5)
+        self.prefetcher = Prefetcher(self.cache, fetch_many, app)
+
+        @app.route('/')
+        def page():
+            return self.prefetcher.after_response(app.make_response('results'), [1, 2, 3, 4, 5])
+
+        self.client = app.test_client()
+
+    def get_page(self):
+        self.client.get('/').close()
+        # wait for the prefetch thread
+        self.prefetcher.executor.submit(lambda: None).result()
+
+    def test_prefetch_top_results(self):
+        self.cache.recipes[2] = {'id': 2}
+        self.get_page()
+
+        self.assertEqual(self.fetched, [[1, 3]])
+        self.assertEqual(set(self.cache.recipes), {1, 2, 3})
+
+        self.prefetcher.record_view(1)
+        self.prefetcher.record_view(1)
+        self.prefetcher.record_view(2)
+        stats = self.prefetcher.get_stats()
+        self.assertEqual(stats['prefetched'], 2)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+        self.assertAlmostEqual(stats['wasted_points'], 0.75)
+
+        # everything is cached now, so nothing more is fetched
+        self.get_page()
+        self.assertEqual(len(self.fetched), 1)
+
+    def test_budget(self):
+        self.prefetcher.budget = self.prefetcher.points = 1
+        self.get_page()
+
+        self.assertEqual(self.fetched, [])
+        self.assertEqual(self.prefetcher.get_stats()['over_budget'], 3)
@@ -0,0 +1,78 @@
+#    run these tests with:
+#
+#    python -m unittest test_quota.py
+#
+# These need neither a database nor a Spoonacular API key.
+
+import threading
+import time
+from unittest import TestCase, mock
+
+import quota
+from quota import QuotaScheduler, QuotaExceeded, SchedulerBusy, priority, INTERACTIVE, SEARCH, BACKGROUND
+
+
+class QuotaSchedulerTestCase(TestCase):
+    """Test the outbound call scheduler"""
+
+    def spend(self, scheduler, level, cost):
+        with priority(level):
+            with scheduler.slot(cost):
+                pass
+
+    def test_reserves(self):
+        scheduler = QuotaScheduler(daily_points=10, search_reserve=0.1, background_reserve=0.3)
+
+        self.spend(scheduler, BACKGROUND, 6)
+        with self.assertRaises(QuotaExceeded):
+            self.spend(scheduler, BACKGROUND, 2)
+        self.spend(scheduler, SEARCH, 2)
+        with self.assertRaises(QuotaExceeded):
+            self.spend(scheduler, SEARCH, 2)
+        self.spend(scheduler, INTERACTIVE, 2)
+
+        stats = scheduler.get_stats()
+        self.assertEqual(stats['background_over_quota'], 1)
+        self.assertEqual(stats['interactive_sent'], 1)
+        self.assertLess(stats['points_left'], 0.01)
+
+    def test_update_from_headers(self):
+        scheduler = QuotaScheduler(daily_points=100)
+
+        scheduler.update({'X-API-Quota-Left': '12.5'})
+        self.assertAlmostEqual(scheduler.get_stats()['points_left'], 12.5, places=1)
+
+        scheduler.update({}, status_code=402)
+        with self.assertRaises(QuotaExceeded):
+            self.spend(scheduler, INTERACTIVE, 1)
+
+    def test_priority_order(self):
+        scheduler = QuotaScheduler(daily_points=100, max_concurrent=1)
+        order = []
+
+        def call(level, name):
+            self.spend(scheduler, level, 1)
+            order.append(name)
+
+        with priority(INTERACTIVE), scheduler.slot(1):
+            threads = [threading.Thread(target=call, args=(BACKGROUND, 'background'))]
+            threads[0].start()
+            time.sleep(0.1)
+            threads.append(threading.Thread(target=call, args=(INTERACTIVE, 'interactive')))
+            threads[1].start()
+            time.sleep(0.1)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(order, ['interactive', 'background'])
+
+    def test_busy(self):
+        scheduler = QuotaScheduler(daily_points=100, max_concurrent=1)
+
+        with mock.patch.dict(quota.SLOT_WAIT, {SEARCH: 0.05}):
+            with priority(INTERACTIVE), scheduler.slot(1):
+                with self.assertRaises(SchedulerBusy):
+                    self.spend(scheduler, SEARCH, 5)
+
+        # the points of a call that wasn't sent are given back
+        self.assertAlmostEqual(scheduler.get_stats()['points_left'], 99, places=1)
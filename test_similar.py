@@ -0,0 +1,126 @@
+# run these tests with:
+#
+#    python -m unittest test_similar.py
+#
+# The route test needs the test database:
+#
+#   createdb capstone_one-test
+
+import os
+from unittest import TestCase, mock
+
+from models import db, User, UserRecipe, Board, Recipe, RecipeIngredient
+
+os.environ['DATABASE_URL'] = 'postgresql:///capstone_one-test'
+
+from app import create_app, recipe_cache, similar_recipes, CURR_USER_KEY
+import similar
+from similar import SimilarityIndex
+
+app = create_app({'TESTING': True})
+
+
+def recipe(recipe_id, *names):
+    return recipe_id, list(names), {'id': recipe_id}
+
+
+class SimilarityIndexTestCase(TestCase):
+    """Test the ingredient similarity index"""
+
+    def setUp(self):
+        self.index = SimilarityIndex([
+            recipe(1, 'chicken', 'rice', 'garlic'),
+            recipe(2, 'chicken', 'rice'),
+            recipe(3, 'chocolate', 'flour', 'sugar'),
+            recipe(4, 'flour', 'sugar', 'butter'),
+            recipe(5),
+        ], top_k=2)
+
+    def ids(self, cards):
+        return [card['id'] for card in cards]
+
+    def test_similar(self):
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.ids(self.index.similar(1)), [2])
+        self.assertEqual(self.ids(self.index.similar(4)), [3])
+        self.assertIsNone(self.index.similar(5))
+
+        self.assertEqual(self.ids(self.index.query(9, ['sugar', 'butter'])), [4, 3])
+        self.assertEqual(self.index.query(9, ['saffron']), [])
+
+    def test_add(self):
+        self.index.add(6, ['chicken', 'garlic'], {'id': 6})
+
+        self.assertEqual(self.ids(self.index.similar(6)), [1, 2])
+        # 6 shares garlic with 1, which is rarer than what 1 shares with 2
+        self.assertEqual(self.ids(self.index.similar(1)), [6, 2])
+        self.assertEqual(self.ids(self.index.similar(2)), [1, 6])
+        self.assertEqual(self.ids(self.index.similar(3)), [4])
+
+        # ingredients the index hasn't seen yet still count
+        self.index.add(7, ['saffron'], {'id': 7})
+        self.index.add(8, ['saffron', 'sugar'], {'id': 8})
+        self.assertEqual(self.ids(self.index.similar(8))[0], 7)
+
+    def test_add_many(self):
+        with mock.patch.object(similar, 'ADD_BUFFER', 2):
+            index = SimilarityIndex([recipe(1, 'chicken', 'rice')], top_k=2)
+            for recipe_id in range(2, 40):
+                index.add(*recipe(recipe_id, 'chicken', f'spice {recipe_id}'))
+
+        self.assertEqual(index.matrix.shape[0] + index.buffer.shape[0], 39)
+        self.assertEqual(self.ids(index.similar(1)), [2, 3])
+        self.assertEqual(len(index.similar(39)), 2)
+        self.assertEqual(self.ids(index.query(99, ['spice 7'])), [7])
+
+
+class SimilarRecipesTestCase(TestCase):
+    """Test the similar recipes panel"""
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+
+        self.user = User.register('cook', 'password', 'cook@testing.com', "Test", "Cook")
+        db.session.commit()
+
+        self.risotto = UserRecipe(title="Risotto", user_id=self.user.id,
+                                  ingredients=RecipeIngredient.from_list(["1 cup arborio rice", "2 cups stock"]))
+        self.cake = UserRecipe(title="Cake", user_id=self.user.id,
+                               ingredients=RecipeIngredient.from_list(["2 cups flour", "1 cup sugar"]))
+        board = Board(name="saved", user_id=self.user.id)
+        db.session.add_all([self.risotto, self.cake, board])
+        db.session.commit()
+
+        paella = {'id': 716429, 'title': 'Paella', 'image': 'https://spoonacular.com/paella.jpg',
+                  'extendedIngredients': [{'name': 'arborio rice'}, {'name': 'saffron'}]}
+        recipe_cache.store({716429: paella})
+        Recipe.add_to_board(board.id, 716429, {'title': 'Paella', 'image': paella['image'], 'source': 'spoonacular'})
+        db.session.commit()
+
+        similar_recipes.rebuild()
+        self.risotto_id = self.risotto.id
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user.id
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_panel(self):
+        res = self.client.get(f'/recipe/created/{self.risotto_id}')
+        html = res.get_data(as_text=True)
+        self.assertIn('Similar Recipes', html)
+        self.assertIn('Paella', html)
+        self.assertNotIn('Cake', html)
+
+    def test_add(self):
+        pudding = UserRecipe(title="Rice Pudding", user_id=self.user.id,
+                             ingredients=RecipeIngredient.from_list(["1 cup arborio rice", "1 cup sugar"]))
+        db.session.add(pudding)
+        db.session.commit()
+        similar_recipes.add(pudding)
+
+        titles = [card['title'] for card in similar_recipes.similar(UserRecipe.query.get(self.risotto_id))]
+        self.assertEqual(set(titles), {'Paella', 'Rice Pudding'})
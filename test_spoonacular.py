@@ -0,0 +1,158 @@
+#    run these tests with:
+#
+#    python -m unittest test_spoonacular.py
+#
+# These run against a stub server on localhost, so they need neither a database
+# nor a Spoonacular API key.
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+from urllib.parse import urlparse, parse_qs
+
+from quota import BACKGROUND, INTERACTIVE, priority
+from spoonacular import SpoonacularClient, SpoonacularError
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    '''Answers with the responses queued for each path, or 404'''
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.server.requests.append((url.path, parse_qs(url.query)))
+        self.server.client_ports.add(self.client_address[1])
+        time.sleep(self.server.delay)
+
+        queue = self.server.responses.get(url.path, [])
+        status, body = queue.pop(0) if len(queue) > 1 else (queue[0] if queue else (404, {}))
+
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class SpoonacularClientTestCase(TestCase):
+    """Test Spoonacular client"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.responses = {}
+        self.server.requests = []
+        self.server.client_ports = set()
+        self.server.delay = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.client = SpoonacularClient(
+            api_key='testkey',
+            base_url=f'http://127.0.0.1:{self.server.server_port}',
+            retries=2,
+            backoff=0,
+            timeout=2
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_information(self):
+        self.server.responses['/recipes/716429/information'] = [(200, {'id': 716429, 'title': 'Pasta'})]
+
+        recipe = self.client.information(716429)
+
+        self.assertEqual(recipe['title'], 'Pasta')
+        path, params = self.server.requests[0]
+        self.assertEqual(params['apiKey'], ['testkey'])
+
+    def test_information_not_found(self):
+        self.assertIsNone(self.client.information(1))
+
+    def test_information_bulk(self):
+        self.server.responses['/recipes/informationBulk'] = [(200, [{'id': 1}, {'id': 2}])]
+
+        recipes = self.client.information_bulk([1, 2])
+
+        self.assertEqual([recipe['id'] for recipe in recipes], [1, 2])
+        self.assertEqual(self.server.requests[0][1]['ids'], ['1,2'])
+
+    def test_search(self):
+        self.server.responses['/recipes/complexSearch'] = [(200, {'results': [{'id': 1}], 'totalResults': 1})]
+
+        data = self.client.search('pasta', 10, offset=20, exclude=['peanuts', 'shellfish'])
+
+        self.assertEqual(data['totalResults'], 1)
+        params = self.server.requests[0][1]
+        self.assertEqual(params['offset'], ['20'])
+        self.assertEqual(params['excludeIngredients'], ['peanuts,shellfish'])
+
+    def test_random(self):
+        self.server.responses['/recipes/random'] = [(200, {'recipes': [{'id': 1}, {'id': 2}]})]
+
+        self.assertEqual(len(self.client.random(2)), 2)
+
+    def test_retries_server_errors(self):
+        self.server.responses['/recipes/random'] = [(503, {}), (429, {}), (200, {'recipes': [{'id': 1}]})]
+
+        self.assertEqual(self.client.random(1), [{'id': 1}])
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_gives_up_after_retries(self):
+        self.server.responses['/recipes/random'] = [(500, {})]
+
+        with self.assertRaises(SpoonacularError):
+            self.client.random(1)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_reuses_connections(self):
+        self.server.responses['/recipes/random'] = [(200, {'recipes': []})]
+
+        for _ in range(3):
+            self.client.random(1)
+
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(self.server.client_ports), 1)
+
+    def test_coalesces_identical_calls(self):
+        self.server.responses['/recipes/1/information'] = [(200, {'id': 1, 'title': 'Pasta'})]
+        self.server.delay = 0.3
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            recipes = list(executor.map(self.client.information, [1] * 5))
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(recipes, [{'id': 1, 'title': 'Pasta'}] * 5)
+        # every caller gets its own copy
+        self.assertEqual(len({id(recipe) for recipe in recipes}), 5)
+        self.assertEqual(self.client.flights.stats, {'calls': 1, 'shared': 4})
+
+    def test_does_not_coalesce_across_priorities(self):
+        self.server.responses['/recipes/1/information'] = [(200, {'id': 1, 'title': 'Pasta'})]
+        self.server.delay = 0.3
+
+        def information(level):
+            with priority(level):
+                return self.client.information(1)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(information, [BACKGROUND, INTERACTIVE, BACKGROUND, INTERACTIVE]))
+
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.client.flights.stats, {'calls': 2, 'shared': 2})
+
+    def test_does_not_coalesce_different_calls(self):
+        self.server.delay = 0.1
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            list(executor.map(self.client.information, [1, 2, 3]))
+
+        self.assertEqual(len(self.server.requests), 3)
@@ -0,0 +1,73 @@
+#    run these tests with:
+#
+#    python -m unittest test_thumbnails.py
+#
+# These need neither a database nor network access.
+
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import TestCase, mock
+
+import requests
+from flask import Flask
+from PIL import Image
+
+from thumbnails import Thumbnails
+
+SRC = 'https://spoonacular.com/recipeImages/716429-556x370.jpg'
+
+
+def jpeg(width, height):
+    out = BytesIO()
+    Image.new('RGB', (width, height), 'orange').save(out, 'JPEG')
+    return out.getvalue()
+
+
+class ThumbnailsTestCase(TestCase):
+    """Test the thumbnail proxy"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        app = Flask(__name__)
+        app.config.update(THUMBNAIL_DIR=self.directory)
+        self.thumbnails = Thumbnails(app)
+        self.thumbnails.session = mock.Mock()
+        self.thumbnails.session.get.return_value = mock.Mock(content=jpeg(556, 370))
+        self.client = app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_url(self):
+        self.assertEqual(self.thumbnails.url(SRC), '/thumb/480?src=https%3A%2F%2Fspoonacular.com%2F'
+                                                   'recipeImages%2F716429-556x370.jpg')
+        for src in ['https://example.com/a.jpg', 'file:///etc/passwd', None]:
+            self.assertEqual(self.thumbnails.url(src), src)
+        self.assertEqual(self.thumbnails.url(SRC, width=100), SRC)
+
+    def test_only_allowed_hosts(self):
+        for url in ['/thumb/480?src=https://example.com/a.jpg', '/thumb/480?src=http://localhost:5000/',
+                    '/thumb/480?src=ftp://spoonacular.com/a.jpg', f'/thumb/100?src={SRC}']:
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+        self.thumbnails.session.get.assert_not_called()
+
+    def test_thumbnail(self):
+        res = self.client.get(f'/thumb/240?src={SRC}')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(Image.open(BytesIO(res.data)).size, (240, 160))
+        self.assertIn('immutable', res.headers['Cache-Control'])
+
+        res = self.client.get(f'/thumb/240?src={SRC}', headers={'If-None-Match': res.headers['ETag']})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(self.thumbnails.session.get.call_count, 1)
+
+    def test_bad_source(self):
+        self.thumbnails.session.get.side_effect = requests.ConnectionError
+        self.assertEqual(self.client.get(f'/thumb/240?src={SRC}').status_code, 404)
+
+        self.thumbnails.session.get.side_effect = None
+        self.thumbnails.session.get.return_value = mock.Mock(content=b'<html>not an image</html>')
+        self.assertEqual(self.client.get(f'/thumb/240?src={SRC}').status_code, 404)
+
+        self.assertEqual(self.thumbnails.locks, {})
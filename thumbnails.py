@@ -0,0 +1,126 @@
+'''Resized copies of recipe images for the card grids.
+
+Cards are shown at a third of the page width, but Spoonacular's images are
+556px wide or more. The /thumb/<width>?src=<image url> route downloads each
+image once, saves a copy resized to width on disk, and serves it with headers
+that let browsers keep it for a year and revalidate it with an ETag.
+
+Only images from THUMBNAIL_HOSTS are proxied, so the route can't be used to make
+the server fetch arbitrary URLs; the thumbnail filter leaves other URLs as they
+are. Resizing needs Pillow. Without it the original image is cached and served.
+'''
+
+import hashlib
+import os
+import tempfile
+import threading
+from io import BytesIO
+from urllib.parse import urlparse, urlencode
+
+import requests
+from flask import abort, request, send_file
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+ONE_YEAR = 60 * 60 * 24 * 365
+
+
+class Thumbnails:
+    '''Downloads, resizes and serves recipe images from a directory on disk'''
+
+    def __init__(self, app=None):
+        self.session = requests.Session()
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Read thumbnail settings from the app config and add the route and template filter'''
+
+        self.app = app
+        self.directory = app.config.setdefault('THUMBNAIL_DIR', os.path.join(app.instance_path, 'thumbnails'))
+        self.hosts = app.config.setdefault('THUMBNAIL_HOSTS', ('spoonacular.com', 'img.spoonacular.com'))
+        self.widths = app.config.setdefault('THUMBNAIL_WIDTHS', (240, 480))
+        self.timeout = app.config.setdefault('THUMBNAIL_TIMEOUT', 10)
+        os.makedirs(self.directory, exist_ok=True)
+
+        app.add_url_rule('/thumb/<int:width>', 'thumbnail', self.serve)
+        app.add_template_filter(self.url, 'thumbnail')
+
+    def allowed(self, src):
+        '''Check if an image url is one we are willing to fetch'''
+
+        url = urlparse(src or '')
+        return url.scheme in ('http', 'https') and url.hostname in self.hosts
+
+    def url(self, src, width=480):
+        '''Url of the thumbnail of an image, or the image itself if it can't be proxied'''
+
+        if not self.allowed(src) or width not in self.widths:
+            return src
+        return f'/thumb/{width}?{urlencode({"src": src})}'
+
+    def serve(self, width):
+        '''Send the thumbnail of the src image, creating it the first time'''
+
+        src = request.args.get('src', '')
+        if not self.allowed(src) or width not in self.widths:
+            abort(404)
+
+        key = hashlib.sha1(src.encode()).hexdigest()
+        path = os.path.join(self.directory, f'{key}-{width}')
+        if not os.path.exists(path):
+            self.create(src, path, width)
+
+        response = send_file(path, mimetype='image/jpeg' if Image else None, add_etags=False, conditional=False,
+                             attachment_filename=os.path.basename(urlparse(src).path))
+        response.set_etag(f'{key}-{width}')
+        response.headers['Cache-Control'] = f'public, max-age={ONE_YEAR}, immutable'
+        return response.make_conditional(request)
+
+    def create(self, src, path, width):
+        '''Download src and save it resized to width at path. Only one thread does this per thumbnail.'''
+
+        with self.locks_lock:
+            lock = self.locks.setdefault(path, threading.Lock())
+
+        try:
+            with lock:
+                if os.path.exists(path):
+                    return
+                try:
+                    res = self.session.get(src, timeout=self.timeout)
+                    res.raise_for_status()
+                except requests.RequestException:
+                    abort(404)
+
+                data = res.content
+                if Image is not None:
+                    try:
+                        data = self.resize(data, width)
+                    except OSError:
+                        abort(404)
+
+                # write to a temporary file first so no one is ever sent half an image
+                fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+                with os.fdopen(fd, 'wb') as tmp:
+                    tmp.write(data)
+                os.replace(tmp_path, path)
+        finally:
+            with self.locks_lock:
+                self.locks.pop(path, None)
+
+    def resize(self, data, width):
+        '''Scale an image down to width, keeping its aspect ratio, and return it as a JPEG'''
+
+        image = Image.open(BytesIO(data))
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+
+        out = BytesIO()
+        image.convert('RGB').save(out, 'JPEG', quality=80, optimize=True, progressive=True)
+        return out.getvalue()